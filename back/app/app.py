@@ -1,4 +1,5 @@
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 
 from fastapi import FastAPI
@@ -6,11 +7,17 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from .database.database import create_db_and_tables
 from .routes import router
+from .services import warm_up, analysis_writer
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await create_db_and_tables()
+    # load models in the background: the API accepts traffic right away and
+    # inference routes answer "warming up" until `warm_up` is done
+    app.state.warm_up = asyncio.create_task(asyncio.to_thread(warm_up))
+    analysis_writer.start()
     yield
+    await analysis_writer.stop()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -4,14 +4,37 @@ from sqlalchemy.ext.asyncio import (create_async_engine,
 from sqlalchemy.orm import DeclarativeBase
 from dotenv import load_dotenv
 import os
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, event
+import time
+
+from back.src.metrics import DB_QUERY_SECONDS
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# SQL statement logging is off by default, it is costly on hot paths
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO)
 session_factory = async_sessionmaker(autocommit=False, 
                                                 autoflush=False, 
                                                 bind=engine)
+
+
+# the start time lives on the execution context: a statement that raises never
+# reaches after_cursor_execute and leaves nothing behind on the pooled connection
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _observe_query_time(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is not None:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start)
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey, Index, func
 from .database import Base
 
 class UserTable(Base):
@@ -6,4 +6,23 @@ class UserTable(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
-    password = Column(String)
\ No newline at end of file
+    password = Column(String)
+
+
+class AnalysisTable(Base):
+    __tablename__ = "analyses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    input_hash = Column(String(64), nullable=False)
+    main_text = Column(Text)
+    additional_context = Column(Text)
+    scorer = Column(JSON)
+    critic = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # history of a user, newest first, and "did this user already analyse this ad"
+        Index("ix_analyses_user_id_id", "user_id", "id"),
+        Index("ix_analyses_user_id_input_hash", "user_id", "input_hash"),
+    )
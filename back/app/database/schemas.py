@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel
 
 class User(BaseModel):
@@ -7,6 +8,36 @@ class User(BaseModel):
 class UserOut(User):
     id: int
 
+class UserPage(BaseModel):
+    items: list[UserOut]
+    next_cursor: int | None = None
+
 class TextEntry(BaseModel):
     main_text: str
-    additional_context: str
\ No newline at end of file
+    additional_context: str
+
+class AnalysisRequest(TextEntry):
+    """Websocket message: the ad to analyse, whether to stream and who asks."""
+    stream: bool = True
+    user_id: int | None = None
+
+    def entry(self) -> TextEntry:
+        return TextEntry(main_text=self.main_text, additional_context=self.additional_context)
+
+class BatchRequest(BaseModel):
+    entries: list[TextEntry]
+    user_id: int | None = None
+
+class AnalysisOut(BaseModel):
+    id: int
+    user_id: int | None
+    input_hash: str
+    main_text: str
+    additional_context: str | None
+    scorer: dict | None
+    critic: dict | None
+    created_at: datetime | None
+
+class AnalysisPage(BaseModel):
+    items: list[AnalysisOut]
+    next_cursor: int | None = None
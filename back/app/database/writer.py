@@ -0,0 +1,102 @@
+import asyncio
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+
+class BufferedWriter:
+    """
+    Write-behind inserts for one table. `record` only enqueues the row; a
+    background task flushes the buffer in one multi-row INSERT every
+    `flush_interval` seconds or as soon as `batch_size` rows are waiting.
+    When the buffer is full, rows are dropped instead of slowing callers down.
+    A batch rejected by a constraint is retried row by row so only the
+    offending rows are lost.
+    """
+    def __init__(self, session_factory, table, batch_size: int = 100,
+                 flush_interval: float = 1.0, max_buffer: int = 10000):
+        self._session_factory = session_factory
+        self._table = table
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self._stopping = asyncio.Event()
+        self._task = None
+        self.dropped = 0
+
+    def record(self, row: dict):
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and flush what is left."""
+        if self._task is not None:
+            # not cancelled: the batch being collected or written is finished first
+            self._stopping.set()
+            await self._task
+            self._task = None
+        while not self._queue.empty():
+            await self._flush(self._drain())
+
+    def _drain(self) -> list[dict]:
+        rows = []
+        while not self._queue.empty() and len(rows) < self._batch_size:
+            rows.append(self._queue.get_nowait())
+        return rows
+
+    async def _insert(self, rows: list[dict]):
+        async with self._session_factory() as session:
+            await session.execute(insert(self._table), rows)
+            await session.commit()
+
+    async def _flush(self, rows: list[dict]):
+        if not rows:
+            return
+        try:
+            await self._insert(rows)
+        except IntegrityError:
+            for row in rows:
+                try:
+                    await self._insert([row])
+                except Exception as e:
+                    self.dropped += 1
+                    print(f"Dropped a row for {self._table.__tablename__}: {e}")
+        except Exception as e:
+            self.dropped += len(rows)
+            print(f"Failed to write {len(rows)} rows to {self._table.__tablename__}: {e}")
+
+    async def _next(self, timeout: float = None):
+        """Next queued row, or None after `timeout` seconds or once stopping."""
+        get = asyncio.ensure_future(self._queue.get())
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        await asyncio.wait({get, stopping}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if get.done():
+            return get.result()
+        # a cancelled get leaves its row on the queue
+        get.cancel()
+        return None
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            row = await self._next()
+            if row is None:
+                break
+            rows = [row]
+            deadline = asyncio.get_running_loop().time() + self._flush_interval
+            while len(rows) < self._batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                row = await self._next(timeout)
+                if row is None:
+                    break
+                rows.append(row)
+            await self._flush(rows)
@@ -1,19 +1,25 @@
 """Shared dependencies (redis, cache, db session). No app/routes imports."""
-import os
-import redis
-
 from .services import Services
+from .my_redis.redis import r
 from .my_redis.utils import CacheProxy
 from .database.database import get_async_session
-
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+from back.config.config import CACHE_TTL
 
 redis_cache = CacheProxy(
     services=Services,
     redis=r,
-    methods_to_flush=["create_user", "delete_user", "update_user", "login"],
+    tags={
+        "read_user": lambda args: [f"user:{args[0]}"],
+        "read_users": lambda args: ["users"],
+    },
+    # write methods only drop the entries they can affect
+    invalidates={
+        "create_user": lambda args, result: ["users"],
+        "update_user": lambda args, result: [f"user:{args[0]}", "users"],
+        "delete_user": lambda args, result: [f"user:{args[0]}", "users"],
+        "login": lambda args, result: ["users"] if result.get("created") else [],
+    },
+    ttl=CACHE_TTL,
 )
 
 __all__ = ["redis_cache", "get_async_session", "r"]
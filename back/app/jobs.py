@@ -0,0 +1,65 @@
+import asyncio
+import json
+import uuid
+from collections import OrderedDict
+
+
+class BatchJob:
+    """
+    Results of one batch analysis, appended as NDJSON lines as ads complete.
+    Any number of readers can `stream` the job, from the first line, while it runs.
+    """
+    def __init__(self, size: int):
+        self.id = uuid.uuid4().hex
+        self.size = size
+        self.lines: list[str] = []
+        self.done = False
+        self._changed = asyncio.Condition()
+
+    async def add(self, record: dict):
+        async with self._changed:
+            self.lines.append(json.dumps(record) + "\n")
+            self._changed.notify_all()
+
+    async def finish(self):
+        async with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    async def stream(self):
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.done or len(self.lines) > sent)
+                lines = self.lines[sent:]
+                done = self.done
+            for line in lines:
+                yield line
+            sent += len(lines)
+            if done and sent == len(self.lines):
+                return
+
+
+class JobStore:
+    """Keeps the last `max_jobs` batch jobs of this process."""
+    def __init__(self, max_jobs: int = 100):
+        self._jobs: OrderedDict[str, BatchJob] = OrderedDict()
+        self._max_jobs = max_jobs
+        self._tasks: set[asyncio.Task] = set()
+
+    def create(self, size: int) -> BatchJob:
+        job = BatchJob(size)
+        self._jobs[job.id] = job
+        while len(self._jobs) > self._max_jobs:
+            self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> BatchJob | None:
+        return self._jobs.get(job_id)
+
+    def run(self, coro):
+        # keep a reference so the background task is not garbage collected
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import json
+from contextlib import asynccontextmanager
+
+from redis.exceptions import RedisError
+
+from back.src.utils import LRUCache
+from back.src.metrics import record_cache
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def input_hash(text_entry) -> str:
+    """Hash of the normalized ad input, independent of the models used."""
+    payload = json.dumps({
+        "main_text": _normalize(text_entry.main_text),
+        "additional_context": _normalize(text_entry.additional_context),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of complete analyses (the list of
+    `{"stage": ..., "result": ...}` frames). An in-process LRU sits in front
+    of Redis, both with the same TTL, and identical concurrent requests are
+    collapsed so only one of them runs the pipeline.
+    """
+    def __init__(self, redis, namespace: str = "analysis", ttl: int = 86400, max_entries: int = 256):
+        self._redis = redis
+        self._namespace = namespace
+        self._ttl = ttl
+        self._local = LRUCache(max_entries, ttl=ttl)
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def key(self, text_entry, fingerprint: dict) -> str:
+        payload = json.dumps({
+            "main_text": _normalize(text_entry.main_text),
+            "additional_context": _normalize(text_entry.additional_context),
+            "pipeline": fingerprint,
+        }, sort_keys=True)
+        return f"{self._namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    async def get(self, key: str) -> list[str] | None:
+        frames = self._local.get(key)
+        record_cache(f"{self._namespace}_local", frames is not None)
+        if frames is not None:
+            return frames
+        try:
+            cached = await self._redis.get(key)
+        except RedisError:
+            cached = None
+        record_cache(f"{self._namespace}_redis", bool(cached))
+        if not cached:
+            return None
+        frames = json.loads(cached)
+        self._local.put(key, frames)
+        return frames
+
+    async def set(self, key: str, frames: list[str]):
+        # never cache failed generations, nor the output of a fallback model
+        decoded = [json.loads(frame) for frame in frames]
+        if any("error" in (frame.get("result") or {}) or frame.get("degraded") for frame in decoded):
+            return
+        self._local.put(key, frames)
+        try:
+            await self._redis.set(key, json.dumps(frames), ex=self._ttl)
+        except RedisError:
+            pass
+
+    @asynccontextmanager
+    async def single_flight(self, key: str):
+        """
+        Yields the cached frames if there are some. Otherwise yields None and
+        the caller is expected to compute and `set` them; identical callers
+        arriving meanwhile wait for it instead of generating again.
+        """
+        while True:
+            cached = await self.get(key)
+            if cached is not None:
+                yield cached
+                return
+            leader = self._inflight.get(key)
+            if leader is None:
+                break
+            # leader failed or its result was not cacheable: try again
+            await asyncio.shield(leader)
+
+        done = asyncio.get_running_loop().create_future()
+        self._inflight[key] = done
+        try:
+            yield None
+        finally:
+            del self._inflight[key]
+            done.set_result(None)
@@ -1,6 +1,18 @@
-# import redis
+import os
 
-# r = redis.Redis(host='localhost', port=6379, decode_responses=True)
+import redis.asyncio as aioredis
 
-# def get_redis():
-#     return r
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+
+# one connection pool shared by every cache in the process
+pool = aioredis.ConnectionPool(host=REDIS_HOST,
+                               port=REDIS_PORT,
+                               max_connections=REDIS_MAX_CONNECTIONS,
+                               decode_responses=True)
+r = aioredis.Redis(connection_pool=pool)
+
+
+def get_redis():
+    return r
@@ -1,5 +1,8 @@
 import json
 from sqlalchemy.ext.asyncio import AsyncSession
+from redis.exceptions import RedisError
+
+from back.src.metrics import record_cache
 
 
 def _serialize_for_cache(val):
@@ -11,15 +14,50 @@ def _serialize_for_cache(val):
     return val
 
 class CacheProxy:
+    """
+    Caches the results of async service methods in Redis (async client).
+
+    - `tags[method](args)` lists the tags a cached result belongs to
+      (default: the method name).
+    - `invalidates[method](args, result)` lists the tags to drop after a write
+      method ran; those methods are never cached themselves.
+
+    Keys live under `namespace`, each tag is a Redis set of the keys tagged with
+    it, so invalidation only deletes what is affected instead of `flushdb()`.
+    """
     def __init__(
         self,
         services,
         redis,
-        methods_to_flush=[]
+        tags=None,
+        invalidates=None,
+        namespace: str = "cache",
+        ttl: int = 300,
     ):
         self._redis = redis
-        self._methods_to_flush = methods_to_flush
         self._services = services
+        self._tags = tags or {}
+        self._invalidates = invalidates or {}
+        self._namespace = namespace
+        self._ttl = ttl
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self._namespace}:tag:{tag}"
+
+    async def invalidate(self, *tags: str):
+        """Delete every key tagged with one of `tags`, and the tag sets themselves."""
+        if not tags:
+            return
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                members = await pipe.execute()
+            keys = set().union(*members)
+            await self._redis.delete(*keys, *tag_keys)
+        except RedisError as e:
+            print(f"Cache invalidation failed for {tags}: {e}")
 
     def __getattr__(self, method_name):
         method = getattr(self._services, method_name)
@@ -28,25 +66,39 @@ class CacheProxy:
             return method
 
         async def wrapper(*args, **kwargs):
-            if method_name in self._methods_to_flush:
-                self._redis.flushdb()
-                return await method(*args, **kwargs)
-
             # need to remove the session from the args
             # we suppose that the `session` argument is the last argument
             args_cache = args[:-1] if len(args) > 0 and isinstance(args[-1], AsyncSession) else args
-            cache_key = f"{method_name}-{json.dumps(args_cache, sort_keys=True)}"
-            cached = self._redis.get(cache_key)
+
+            if method_name in self._invalidates:
+                result = await method(*args, **kwargs)
+                await self.invalidate(*self._invalidates[method_name](args_cache, result))
+                return result
+
+            cache_key = f"{self._namespace}:{method_name}-{json.dumps(args_cache, sort_keys=True, default=str)}"
+            try:
+                cached = await self._redis.get(cache_key)
+            except RedisError:
+                cached = None
             if cached is not None and cached != "":
                 # CACHE HIT - returning from cache (no DB)
+                record_cache(self._namespace, True)
                 return json.loads(cached)
+            record_cache(self._namespace, False)
 
             # CACHE MISS - executing method and caching result
             result = await method(*args, **kwargs)
             to_cache = _serialize_for_cache(result)
-            self._redis.set(cache_key, json.dumps(to_cache, default=str))
+            tags = self._tags.get(method_name, lambda _: [method_name])(args_cache)
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.set(cache_key, json.dumps(to_cache, default=str), ex=self._ttl)
+                    for tag in tags:
+                        pipe.sadd(self._tag_key(tag), cache_key)
+                        pipe.expire(self._tag_key(tag), self._ttl)
+                    await pipe.execute()
+            except RedisError:
+                pass
             return to_cache
 
         return wrapper
-
-
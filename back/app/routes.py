@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, WebSocket
+from fastapi import APIRouter, Depends, WebSocket, Response, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .deps import redis_cache, get_async_session
 from .services import Services
-from .database.schemas import User, UserOut
+from .database.schemas import User, UserOut, UserPage, BatchRequest, AnalysisOut, AnalysisPage
+from back.config.config import USERS_PAGE_SIZE, USERS_PAGE_MAX
+from back.src.metrics import render
 
 router = APIRouter()
 
@@ -13,6 +15,24 @@ async def handle_read_root():
     return await redis_cache.read_root()
 
 
+@router.get("/health/live")
+async def liveness() -> dict:
+    return await Services.liveness()
+
+
+@router.get("/health/ready")
+async def readiness():
+    """503 until the models are loaded, so orchestrators only route inference once ready."""
+    return await Services.readiness()
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of latency histograms, queue and cache counters."""
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
+
+
 @router.post("/users")
 async def create_user(
     user: User, db_session: AsyncSession = Depends(get_async_session)
@@ -22,9 +42,18 @@ async def create_user(
 
 @router.get("/users")
 async def read_users(
+    cursor: int | None = None,
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_PAGE_MAX),
     db_session: AsyncSession = Depends(get_async_session)
-) -> list[UserOut]:
-    return await redis_cache.read_users(db_session)
+) -> UserPage:
+    """Users with id > cursor; pass `next_cursor` back to get the next page."""
+    return await redis_cache.read_users(cursor, limit, db_session)
+
+
+@router.get("/users/export")
+async def export_users():
+    """Every user as NDJSON, streamed without loading the table in memory."""
+    return await Services.export_users()
 
 
 @router.get("/users/{user_id}")
@@ -61,6 +90,38 @@ async def login(
 
 
 
+@router.get("/users/{user_id}/analyses")
+async def read_analyses(
+    user_id: int,
+    cursor: int | None = None,
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_PAGE_MAX),
+    input_hash: str | None = None,
+    db_session: AsyncSession = Depends(get_async_session)
+) -> AnalysisPage:
+    """Past analyses of a user, newest first, optionally only those of one input."""
+    return await Services.read_analyses(user_id, cursor, limit, input_hash, db_session)
+
+
+@router.get("/analyses/{analysis_id}")
+async def read_analysis(
+    analysis_id: int,
+    db_session: AsyncSession = Depends(get_async_session)
+) -> AnalysisOut:
+    return await Services.read_analysis(analysis_id, db_session)
+
+
+@router.post("/api/batch")
+async def create_batch(batch: BatchRequest) -> dict:
+    """Queue a batch of ads for analysis, returns the job id."""
+    return await Services.create_batch(batch)
+
+
+@router.get("/api/batch/{job_id}")
+async def stream_batch(job_id: str):
+    """Per-ad results of a batch job as NDJSON, streamed as they complete."""
+    return await Services.stream_batch(job_id)
+
+
 @router.websocket("/api/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -1,42 +1,201 @@
-from .database.schemas import User, UserOut, TextEntry
-from .database.models import UserTable
+from .database.schemas import (User, UserOut, UserPage, TextEntry, AnalysisRequest,
+                               BatchRequest, AnalysisOut, AnalysisPage)
+from .database.database import session_factory
+from .database.models import UserTable, AnalysisTable
+from .database.writer import BufferedWriter
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text
+from sqlalchemy import select
 from fastapi import HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
 from typing import Any
 from fastapi import WebSocket, WebSocketDisconnect
 import json
 import asyncio
-import multiprocessing
-from concurrent.futures import ThreadPoolExecutor
-from back.config.config import MODEL_CONFIG
+from contextlib import aclosing
+from back.config.config import (SCHEDULER_CONFIG, ANALYSIS_CACHE_CONFIG,
+                                BATCH_CONFIG, INFERENCE_BACKEND, WORKER_CONFIG,
+                                USERS_EXPORT_BATCH_SIZE, HISTORY_WRITER_CONFIG)
+from .my_redis.redis import r
+from .my_redis.analysis_cache import AnalysisCache, input_hash
+from .jobs import JobStore, BatchJob
 
-from back.src.core.pipeline import Pipeline
-from back.src.core.local_llm import ScorerV1, CriticV1
+from back.src.core.Pipeline import Pipeline, pipeline_fingerprint
+from back.src.core.router import build_role
+from back.src.core.scheduler import InferenceScheduler, SchedulerBusy
+from back.archi.client import RemoteInference
+from back.src.metrics import ACTIVE_WEBSOCKETS, QUEUE_DEPTH, INFERENCE_RUNNING
+from back.src.rag.embedder import get_embedder
 import time
 
-scorer_llm = ScorerV1(**MODEL_CONFIG)
-scorer_llm.load()
+# models are only built here; weights are loaded by `warm_up` in the background
+# requests go to a role's fallback model when the scheduler backlog builds up
+scorer_llm = build_role("scorer", queue_depth=lambda: inference_scheduler.queue_depth)
+critic_llm = build_role("critic", queue_depth=lambda: inference_scheduler.queue_depth)
+analysis_fingerprint = pipeline_fingerprint(scorer_llm, critic_llm)
 
-critic_llm = CriticV1(**MODEL_CONFIG)
-critic_llm.load()
+pipeline: Pipeline = None
+remote_inference = None
+warmup_state = {"status": "pending", "error": None}
 
-pipeline = Pipeline(scorer_llm, critic_llm)
+if INFERENCE_BACKEND == "redis":
+    # models live in the worker processes (back/archi/worker.py)
+    remote_inference = RemoteInference(r, **WORKER_CONFIG)
+    warmup_state["status"] = "ready"
 
-_inference_executor = ThreadPoolExecutor(
-    max_workers=max(2, multiprocessing.cpu_count() - 1)
-)
+inference_scheduler = InferenceScheduler(**SCHEDULER_CONFIG)
+QUEUE_DEPTH.set_function(lambda: inference_scheduler.queue_depth)
+INFERENCE_RUNNING.set_function(lambda: inference_scheduler.running)
+analysis_cache = AnalysisCache(r, **ANALYSIS_CACHE_CONFIG)
+batch_jobs = JobStore(max_jobs=BATCH_CONFIG["max_jobs"])
+analysis_writer = BufferedWriter(session_factory, AnalysisTable, **HISTORY_WRITER_CONFIG)
+WARMUP_RETRY_AFTER = 5
+
+
+def warm_up():
+    """
+    Load the models, the embedder and the vector store (blocking). Started in
+    a thread from the app lifespan so the API serves traffic meanwhile.
+    """
+    global pipeline
+    if warmup_state["status"] != "pending":
+        return
+    warmup_state["status"] = "warming_up"
+    time_start = time.time()
+    try:
+        scorer_llm.load()
+        critic_llm.load()
+        warm_pipeline = Pipeline(scorer_llm, critic_llm)
+        get_embedder().load()
+        pipeline = warm_pipeline
+        warmup_state["status"] = "ready"
+        print(f"Models warmed up in {time.time() - time_start:.1f} seconds")
+    except Exception as e:
+        warmup_state["status"] = "failed"
+        warmup_state["error"] = str(e)
+        print(f"Warm-up failed: {e}")
+
+
+def is_ready() -> bool:
+    return warmup_state["status"] == "ready"
 
 
 def db_obj_to_dict(obj: Any) -> dict:
     return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
 
+
+def analysis_frames(text_entry: TextEntry, stream: bool = True):
+    """Frames of one analysis, from the local scheduler or the worker tier."""
+    if remote_inference is not None:
+        return remote_inference.stream(text_entry, stream)
+    return inference_scheduler.stream(pipeline.stream if stream else pipeline.run, text_entry)
+
+
+async def analyse(text_entry: TextEntry, context: str = None) -> list[str]:
+    """Stage result frames of one analysis (non-streaming)."""
+    if remote_inference is not None:
+        return await remote_inference.run(text_entry, context)
+    return await inference_scheduler.submit(lambda: list(pipeline.run(text_entry, context)))
+
+
+def frames_to_record(index: int, frames: list[str]) -> dict:
+    """Stage frames of one ad -> one NDJSON record {"index", "scorer", "critic"}."""
+    record = {"index": index}
+    for frame in frames:
+        frame = json.loads(frame)
+        record[frame["stage"]] = frame["result"]
+    return record
+
+
+def record_analysis(text_entry: TextEntry, frames: list[str], user_id: int | None):
+    """Queue a finished analysis for the history table (write-behind, never blocks)."""
+    results = frames_to_record(0, frames)
+    analysis_writer.record({
+        "user_id": user_id,
+        "input_hash": input_hash(text_entry),
+        "main_text": text_entry.main_text,
+        "additional_context": text_entry.additional_context,
+        "scorer": results.get("scorer"),
+        "critic": results.get("critic"),
+    })
+
+
+async def run_batch(job: BatchJob, entries: list[TextEntry], user_id: int | None = None):
+    """
+    Analyse every entry of a batch job. Cached analyses are emitted first,
+    contexts of the others are built with one encoder call and one vector-store
+    query, then generations are fed to the scheduler just fast enough to keep
+    every model slot busy without filling the shared queue.
+    """
+    keys = [analysis_cache.key(entry, analysis_fingerprint) for entry in entries]
+    pending = []
+    try:
+        for i, key in enumerate(keys):
+            cached = await analysis_cache.get(key)
+            if cached is not None:
+                await job.add(frames_to_record(i, cached))
+                record_analysis(entries[i], cached, user_id)
+            else:
+                pending.append(i)
+
+        if remote_inference is None:
+            contexts = await asyncio.to_thread(
+                pipeline.build_contexts, [entries[i].main_text for i in pending]
+            )
+        else:
+            # workers retrieve their own context
+            contexts = [None] * len(pending)
+        todo = asyncio.Queue()
+        for i, context in zip(pending, contexts):
+            todo.put_nowait((i, context))
+
+        async def worker():
+            while not todo.empty():
+                i, context = todo.get_nowait()
+                try:
+                    async with analysis_cache.single_flight(keys[i]) as cached:
+                        if cached is None:
+                            while True:
+                                try:
+                                    cached = await analyse(entries[i], context)
+                                    break
+                                except SchedulerBusy as e:
+                                    await asyncio.sleep(e.retry_after)
+                            await analysis_cache.set(keys[i], cached)
+                    await job.add(frames_to_record(i, cached))
+                    record_analysis(entries[i], cached, user_id)
+                except Exception as e:
+                    await job.add({"index": i, "error": str(e)})
+
+        if remote_inference is not None:
+            n_workers = min(len(pending), remote_inference.capacity + 1)
+        else:
+            n_workers = min(len(pending), inference_scheduler.max_concurrency + 1)
+        await asyncio.gather(*(worker() for _ in range(n_workers)))
+    except Exception as e:
+        print(f"Batch {job.id} failed: {e}")
+        await job.add({"error": "Batch failed", "details": str(e)})
+    finally:
+        await job.finish()
+
 class Services:
     @staticmethod
     async def read_root():
         return {"message": "Hello, World!"}
 
 
+    @staticmethod
+    async def liveness() -> dict:
+        return {"status": "alive"}
+
+
+    @staticmethod
+    async def readiness() -> JSONResponse:
+        """200 once inference can be served, 503 while the models are warming up."""
+        return JSONResponse(status_code=200 if is_ready() else 503,
+                            content={"status": warmup_state["status"],
+                                     "error": warmup_state["error"]})
+
+
     @staticmethod
     async def create_user(user: User, db_session: AsyncSession) -> UserOut:
         user_entry = UserTable(**user.model_dump())
@@ -47,9 +206,32 @@ class Services:
 
 
     @staticmethod
-    async def read_users(db_session: AsyncSession) -> list[UserOut]:
-        res = await db_session.execute(text(f"select * from {UserTable.__tablename__}"))
-        return [UserOut(**dict(row)) for row in res.mappings().all()]
+    async def read_users(cursor: int | None, limit: int, db_session: AsyncSession) -> UserPage:
+        """One page of users with id > cursor (keyset pagination on the primary key)."""
+        query = select(UserTable).order_by(UserTable.id).limit(limit + 1)
+        if cursor is not None:
+            query = query.where(UserTable.id > cursor)
+        result = await db_session.execute(query)
+        rows = result.scalars().all()
+        items = [UserOut(**db_obj_to_dict(row)) for row in rows[:limit]]
+        next_cursor = items[-1].id if len(rows) > limit else None
+        return UserPage(items=items, next_cursor=next_cursor)
+
+
+    @staticmethod
+    async def export_users() -> StreamingResponse:
+        """All users as NDJSON, streamed from a server-side cursor."""
+        async def rows():
+            async with session_factory() as session:
+                result = await session.stream(
+                    select(UserTable)
+                    .order_by(UserTable.id)
+                    .execution_options(yield_per=USERS_EXPORT_BATCH_SIZE)
+                )
+                async for user in result.scalars():
+                    yield UserOut(**db_obj_to_dict(user)).model_dump_json() + "\n"
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 
     @staticmethod
@@ -110,6 +292,7 @@ class Services:
             new_user = await Services.create_user(user, db_session)
             return {"success": True, 
                     "message": "User created successfully", 
+                    "created": True,
                     "user": db_obj_to_dict(new_user)}
         else:
             if db_user.password != user.password:
@@ -119,6 +302,62 @@ class Services:
                     "user": db_obj_to_dict(db_user)}
 
 
+    #### Analysis history
+    @staticmethod
+    async def read_analyses(user_id: int, cursor: int | None, limit: int,
+                            input_hash: str | None, db_session: AsyncSession) -> AnalysisPage:
+        """A user's analyses, newest first, with id < cursor."""
+        query = (select(AnalysisTable)
+                 .where(AnalysisTable.user_id == user_id)
+                 .order_by(AnalysisTable.id.desc())
+                 .limit(limit + 1))
+        if cursor is not None:
+            query = query.where(AnalysisTable.id < cursor)
+        if input_hash is not None:
+            query = query.where(AnalysisTable.input_hash == input_hash)
+        result = await db_session.execute(query)
+        rows = result.scalars().all()
+        items = [AnalysisOut(**db_obj_to_dict(row)) for row in rows[:limit]]
+        next_cursor = items[-1].id if len(rows) > limit else None
+        return AnalysisPage(items=items, next_cursor=next_cursor)
+
+
+    @staticmethod
+    async def read_analysis(analysis_id: int, db_session: AsyncSession) -> AnalysisOut:
+        result = await db_session.execute(
+            select(AnalysisTable).where(AnalysisTable.id == analysis_id)
+        )
+        analysis = result.scalars().first()
+        if analysis is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        return AnalysisOut(**db_obj_to_dict(analysis))
+
+
+    #### Batch analysis
+    @staticmethod
+    async def create_batch(batch: BatchRequest) -> dict:
+        if not is_ready():
+            raise HTTPException(status_code=503,
+                                detail=f"Models are {warmup_state['status']}",
+                                headers={"Retry-After": str(WARMUP_RETRY_AFTER)})
+        if not batch.entries:
+            raise HTTPException(status_code=400, detail="Batch is empty")
+        if len(batch.entries) > BATCH_CONFIG["max_size"]:
+            raise HTTPException(status_code=413,
+                                detail=f"Batch larger than {BATCH_CONFIG['max_size']} entries")
+        job = batch_jobs.create(len(batch.entries))
+        batch_jobs.run(run_batch(job, batch.entries, batch.user_id))
+        return {"job_id": job.id, "size": job.size}
+
+
+    @staticmethod
+    async def stream_batch(job_id: str) -> StreamingResponse:
+        job = batch_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Batch job not found")
+        return StreamingResponse(job.stream(), media_type="application/x-ndjson")
+
+
     @staticmethod
     async def websocket_endpoint(websocket: WebSocket):
         """
@@ -127,30 +366,55 @@ class Services:
         """
         await websocket.accept()
         print("WebSocket client connected")
+        ACTIVE_WEBSOCKETS.inc()
 
         try:
             while True:
                 try:
                     # Wait for messages from this client
                     data = await websocket.receive_text()
-                    message = json.loads(data)
+                    request = AnalysisRequest.model_validate_json(data)
+                    stream = request.stream
+                    user_id = request.user_id
 
-                    text_entry = TextEntry(**message)
+                    text_entry = request.entry()
 
-                    def run_pipeline():
-                        pipeline.ingest(text_entry)
-                        return list(pipeline.run())
+                    if not is_ready():
+                        await websocket.send_text(json.dumps({
+                            "error": "warming_up",
+                            "details": f"Models are {warmup_state['status']}, retry shortly",
+                            "retry_after": WARMUP_RETRY_AFTER
+                        }))
+                        continue
 
                     time_start = time.time()
-                    loop = asyncio.get_event_loop()
-                    results = await loop.run_in_executor(
-                        _inference_executor, run_pipeline
-                    )
+                    cache_key = analysis_cache.key(text_entry, analysis_fingerprint)
+                    try:
+                        async with analysis_cache.single_flight(cache_key) as cached:
+                            if cached is not None:
+                                for out in cached:
+                                    await websocket.send_text(out)
+                                record_analysis(text_entry, cached, user_id)
+                            else:
+                                # stream: token deltas and stage results as they are produced
+                                results = []
+                                # closed as soon as sending fails, which cancels the inference
+                                async with aclosing(analysis_frames(text_entry, stream)) as frames:
+                                    async for out in frames:
+                                        await websocket.send_text(out)
+                                        if "result" in json.loads(out):
+                                            results.append(out)
+                                await analysis_cache.set(cache_key, results)
+                                record_analysis(text_entry, results, user_id)
+                    except SchedulerBusy as e:
+                        await websocket.send_text(json.dumps({
+                            "error": "busy",
+                            "details": str(e),
+                            "retry_after": e.retry_after
+                        }))
+                        continue
                     time_end = time.time()
                     print(f"Time taken: {time_end - time_start} seconds")
-                    for out in results:
-                        print("Out: ", out)
-                        await websocket.send_text(out)
 
                 except WebSocketDisconnect:
                     break  # client left, don't try to send
@@ -175,3 +439,5 @@ class Services:
                 await websocket.close()
             except:
                 pass
+        finally:
+            ACTIVE_WEBSOCKETS.dec()
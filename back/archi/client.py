@@ -0,0 +1,91 @@
+"""
+API side of the inference worker tier: enqueues analysis jobs on a Redis
+stream and relays the frames workers publish back on a per-job stream.
+"""
+import json
+import uuid
+
+from back.src.core.scheduler import SchedulerBusy
+
+
+class RemoteInference:
+    """
+    A job first waits in the jobs stream for up to `queue_timeout` seconds,
+    until a worker publishes its "started" frame; a job no worker picked up
+    in time, or whose caller went away, is deleted from the stream so it is
+    never run for nobody. Once started, each frame must follow the previous
+    one within `timeout` seconds. `capacity` is the number of jobs the worker
+    tier runs at once, which bounds batch fan-out.
+    """
+    def __init__(self,
+                 redis,
+                 jobs_stream: str = "analysis:jobs",
+                 results_prefix: str = "analysis:results:",
+                 max_queue: int = 64,
+                 timeout: int = 300,
+                 queue_timeout: int = 600,
+                 capacity: int = 1,
+                 **_):
+        self._redis = redis
+        self.jobs_stream = jobs_stream
+        self.results_prefix = results_prefix
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.capacity = max(1, capacity)
+
+    async def queue_depth(self) -> int:
+        # workers delete jobs once acknowledged: length = queued + running
+        return await self._redis.xlen(self.jobs_stream)
+
+    async def submit(self, text_entry, stream: bool = True, context: str = None) -> tuple[str, str]:
+        """Enqueue a job; returns its id and the id of its message in the jobs stream."""
+        depth = await self.queue_depth()
+        if depth >= self.max_queue:
+            raise SchedulerBusy(max(1, depth // 2))
+        job_id = uuid.uuid4().hex
+        job = {"job_id": job_id, "entry": text_entry.model_dump_json(), "stream": int(stream)}
+        if context is not None:
+            job["context"] = context
+        message_id = await self._redis.xadd(self.jobs_stream, job)
+        return job_id, message_id
+
+    async def frames(self, job_id: str, message_id: str = None):
+        """Yield the frames of a job until the worker marks it done."""
+        results_key = f"{self.results_prefix}{job_id}"
+        last_id = "0-0"
+        started = False
+        try:
+            while True:
+                timeout = self.timeout if started else self.queue_timeout
+                response = await self._redis.xread({results_key: last_id},
+                                                   block=timeout * 1000,
+                                                   count=100)
+                if not response:
+                    if started:
+                        raise TimeoutError(f"Inference worker stopped answering job {job_id}")
+                    raise TimeoutError(f"No inference worker picked up job {job_id}")
+                for _, messages in response:
+                    for entry_id, fields in messages:
+                        last_id = entry_id
+                        if "started" in fields:
+                            started = True
+                            continue
+                        if "done" in fields:
+                            if fields.get("error"):
+                                raise RuntimeError(fields["error"])
+                            return
+                        yield fields["frame"]
+        finally:
+            if not started and message_id is not None:
+                # still queued: no worker should run it anymore
+                await self._redis.xdel(self.jobs_stream, message_id)
+            await self._redis.delete(results_key)
+
+    async def stream(self, text_entry, stream: bool = True, context: str = None):
+        job_id, message_id = await self.submit(text_entry, stream, context)
+        async for frame in self.frames(job_id, message_id):
+            yield frame
+
+    async def run(self, text_entry, context: str = None) -> list[str]:
+        return [frame async for frame in self.stream(text_entry, False, context)]
@@ -1,66 +1,93 @@
-# from celery import Celery
-# import os
-# import ollama
-# from pydantic import BaseModel
-# import logging
+"""
+Inference worker: loads the scorer/critic models once, consumes analysis jobs
+from a Redis stream (consumer group, so any number of workers on any host can
+share the load) and publishes every frame on a per-job result stream read by
+`archi.client.RemoteInference`.
 
-# # Configure logging
-# logging.basicConfig(level=logging.INFO)
-# logger = logging.getLogger(__name__)
+    python -m back.archi.worker
+"""
+import os
+import socket
+import threading
+import traceback
 
-# # Create Ollama client with Docker service host
-# ollama_host = os.getenv("OLLAMA_HOST", "http://ollama:11434")
-# ollama_client = ollama.Client(host=ollama_host)
-# logger.info(f"Ollama client configured with host: {ollama_host}")
+import redis
 
-# app = Celery(
-#     'get_movie_info_llama', 
-#     broker=os.getenv("CELERY_BROKER_URL"), 
-#     backend=os.getenv("CELERY_BROKER_URL")
-# )
-# class Movie(BaseModel):
-#     title: str
-#     description: str
-#     rating: float
-#     year: int
-#     genre: list[str]
+from back.config.config import WORKER_CONFIG
+from back.app.database.schemas import TextEntry
+from back.src.core.Pipeline import Pipeline
+from back.src.core.router import build_role
 
-# @app.task
-# def get_movie_info_llama(prompt):
-#     logger.info(f"Processing prompt: {prompt}")
-    
-#     stream = ollama_client.chat(
-#         model="llama3.2:1b",
-#         messages=[
-#             {"role": "system", "content": "You are a helpful assistant that answers questions about movies. Respond with JSON only."},
-#             {"role": "user", "content": f"{prompt} summarize the movie in 20 words or less"}
-#         ],
-#         stream=True,
-#         options={
-#             "num_predict": 150,  # Limit max tokens (faster generation)
-#             "temperature": 0.7,  # Lower = faster, more deterministic
-#             "num_ctx": 512,  # Smaller context window = faster
-#             "num_thread": 4,  # Use more CPU threads
-#         }
-#     )
-    
-#     # Accumulate the full response from stream
-#     full_content = ""
-#     for chunk in stream:
-#         if "message" in chunk and "content" in chunk["message"]:
-#             content = chunk["message"]["content"]
-#             full_content += content
-    
-#     logger.info(f"Response received ({full_content} chars)")
-    
-#     # Extract JSON if wrapped in text
-#     import re
-#     json_match = re.search(r'\{.*\}', full_content, re.DOTALL)
-#     if json_match:
-#         full_content = json_match.group(0)
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 
-#     return full_content
-#     # Parse JSON response
-#     movie = Movie.model_validate_json(full_content)
-#     logger.info(f"Parsed movie: {movie}")
-#     return movie.model_dump_json()
\ No newline at end of file
+JOBS_STREAM = WORKER_CONFIG["jobs_stream"]
+RESULTS_PREFIX = WORKER_CONFIG["results_prefix"]
+GROUP = WORKER_CONFIG["group"]
+
+
+def handle_job(r: redis.Redis, pipeline: Pipeline, fields: dict):
+    results_key = f"{RESULTS_PREFIX}{fields['job_id']}"
+    done = {"done": 1}
+    # the client's frame timeout starts here, not while the job was queued
+    r.xadd(results_key, {"started": 1})
+    try:
+        text_entry = TextEntry.model_validate_json(fields["entry"])
+        if fields.get("stream") == "1":
+            frames = pipeline.stream(text_entry)
+        else:
+            frames = pipeline.run(text_entry, fields.get("context"))
+        for frame in frames:
+            r.xadd(results_key, {"frame": frame})
+    except Exception as e:
+        traceback.print_exc()
+        done["error"] = str(e)
+    finally:
+        r.xadd(results_key, done)
+        r.expire(results_key, WORKER_CONFIG["result_ttl"])
+
+
+def consume(r: redis.Redis, pipeline: Pipeline, consumer: str):
+    while True:
+        response = r.xreadgroup(GROUP, consumer, {JOBS_STREAM: ">"}, count=1, block=5000)
+        if not response:
+            # idle: take over jobs left pending by a worker that died
+            _, claimed, *_ = r.xautoclaim(JOBS_STREAM, GROUP, consumer,
+                                          min_idle_time=WORKER_CONFIG["claim_idle_ms"],
+                                          count=1)
+            response = [(JOBS_STREAM, claimed)] if claimed else []
+        for _, messages in response:
+            for message_id, fields in messages:
+                if fields:
+                    handle_job(r, pipeline, fields)
+                r.xack(JOBS_STREAM, GROUP, message_id)
+                r.xdel(JOBS_STREAM, message_id)
+
+
+def main():
+    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    try:
+        r.xgroup_create(JOBS_STREAM, GROUP, id="0", mkstream=True)
+    except redis.ResponseError:
+        pass  # group already exists
+
+    scorer_llm = build_role("scorer")
+    scorer_llm.load()
+    critic_llm = build_role("critic")
+    critic_llm.load()
+    pipeline = Pipeline(scorer_llm, critic_llm)
+
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    threads = [
+        threading.Thread(target=consume, args=(r, pipeline, f"{name}-{i}"), daemon=True)
+        for i in range(max(1, WORKER_CONFIG["concurrency"]))
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Worker {name} consuming {JOBS_STREAM} with {len(threads)} thread(s)")
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
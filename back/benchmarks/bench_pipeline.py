@@ -0,0 +1,257 @@
+"""
+Stage-level microbenchmarks for the RAG + LLM pipeline.
+
+Every stage is timed in isolation over synthetic inputs of configurable size
+and the results are written as JSON (p50/p95/mean in ms, tokens/s for the LLM
+stages) so runs can be compared before deploying:
+
+    python -m back.benchmarks.bench_pipeline --sizes 50,200,800 --out bench.json
+    python -m back.benchmarks.bench_pipeline --model-path models/tiny.gguf
+    python -m back.benchmarks.bench_pipeline --model-path models/tiny.gguf --draft-tokens 10
+    python -m back.benchmarks.bench_pipeline --model-path models/tiny.gguf --concurrency 8 --continuous-batching
+
+Without a GGUF file the LLM stages run against a deterministic stub model,
+which measures the streaming / parsing plumbing rather than llama.cpp.
+The vector store is created in a temporary directory, never in DATA_PATH.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+WORDS = ("shampoo hair clinically proven formula gentle scalp shine volume "
+         "natural brand offer buy now fresh repair damaged daily care results "
+         "dermatologist tested new bottle smooth strong keratin argan").split()
+
+STUB_OUTPUT = json.dumps({
+    "clarity": 7,
+    "brand_alignment": 8,
+    "compliance": 6,
+    "conversion": 7,
+    "justification": "Clear benefit, strong call to action, claim needs a source.",
+})
+
+
+def synthetic_text(n_words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    sentences = []
+    while n_words > 0:
+        length = min(n_words, rng.randint(6, 18))
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + ".")
+        n_words -= length
+    return " ".join(sentences)
+
+
+def summarize(stage: str, size, samples: list[float], tokens: list[int] = None) -> dict:
+    ms = np.array(samples) * 1000
+    result = {
+        "stage": stage,
+        "size": size,
+        "n": len(samples),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "mean_ms": float(ms.mean()),
+    }
+    if tokens is not None:
+        total_s = float(np.sum(samples))
+        result["tokens"] = int(np.sum(tokens))
+        result["tokens_per_s"] = result["tokens"] / total_s if total_s > 0 else 0.0
+    return result
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+class StubModel:
+    """Deterministic stand-in for a llama.cpp role: streams a fixed JSON answer."""
+    max_tokens = 200
+
+    def __init__(self, output: str = STUB_OUTPUT):
+        self._tokens = [token + " " for token in output.split(" ")]
+
+    def predict(self, prompt: str, stream: bool = True, **kwargs):
+        for token in self._tokens:
+            yield {"choices": [{"text": token}]}
+
+
+def bench_llm(model, prompt: str, repeat: int, size) -> list[dict]:
+    """Prefill = time to first token, decode = the rest, per repetition."""
+    prefill, decode, decoded = [], [], []
+    for i in range(repeat + 1):
+        # unique first line so no KV state from the previous run can be reused
+        run_prompt = f"[run {i}]\n{prompt}"
+        start = time.perf_counter()
+        first = None
+        n_tokens = 0
+        for _ in model.predict(run_prompt, stream=True):
+            if first is None:
+                first = time.perf_counter()
+            n_tokens += 1
+        end = time.perf_counter()
+        if i == 0:
+            continue  # warm-up
+        first = first or end
+        prefill.append(first - start)
+        decode.append(end - first)
+        decoded.append(max(0, n_tokens - 1))
+    return [summarize("llm_prefill", size, prefill),
+            summarize("llm_decode", size, decode, decoded)]
+
+
+def bench_concurrent(model, prompt: str, concurrency: int, repeat: int, size) -> dict:
+    """Aggregate decode throughput of `concurrency` simultaneous generations."""
+    def generate(i):
+        return sum(1 for _ in model.predict(f"[user {i}]\n{prompt}", stream=True))
+
+    samples, tokens = [], []
+    with ThreadPoolExecutor(concurrency) as executor:
+        for r in range(repeat):
+            start = time.perf_counter()
+            counts = list(executor.map(generate, range(r * concurrency, (r + 1) * concurrency)))
+            samples.append(time.perf_counter() - start)
+            tokens.append(sum(counts))
+    return {**summarize(f"llm_concurrent_{concurrency}", size, samples, tokens), "concurrency": concurrency}
+
+
+def run(sizes: list[int], repeat: int, k: int, model_path: str = None, draft_tokens: int = 0,
+        concurrency: int = 1, continuous_batching: bool = False) -> list[dict]:
+    from back.src.preprocessing.chunker import chunk_text
+    from back.src.rag.embedder import get_embedder
+    from back.src.rag.retriever import retrieve
+    from back.src.rag.indexer import build_context
+    from back.src.rag import vector_store
+    from back.src.rag.populate_db import populate_vector_store, discover_documents
+    from back.src.prompts.prompts import score_prompt
+    from back.src.utils import process_llm_output
+
+    results = []
+    embedder = get_embedder()
+    embedder.load()
+
+    # ingestion: chunking, then the whole populate path cold and warm
+    for size in sizes:
+        text = synthetic_text(size * 20, seed=size)
+        results.append(summarize("chunk_text", size * 20, measure(lambda: list(chunk_text(text)), repeat)))
+
+    documents = discover_documents()
+
+    def cold_populate():
+        for source in documents:
+            vector_store.delete_source(source)
+        vector_store.save_manifest({})
+        populate_vector_store(vector_store.get_collection())
+
+    results.append(summarize("populate_vector_store_cold", len(documents),
+                             measure(cold_populate, repeat)))
+    results.append(summarize("populate_vector_store_warm", len(documents),
+                             measure(lambda: populate_vector_store(vector_store.get_collection()), repeat)))
+    vector_store.refresh_index()
+
+    if model_path:
+        from back.src.core.local_llm import ScorerV1
+        model = ScorerV1(model_path, n_ctx=4096, n_threads=os.cpu_count() or 1, n_slots=concurrency,
+                         draft_tokens=draft_tokens, continuous_batching=continuous_batching,
+                         max_sequences=concurrency)
+        model.load()
+    else:
+        model = StubModel()
+
+    for size in sizes:
+        ad = synthetic_text(size, seed=size)
+        # embedding cache disabled so the encoder is actually measured
+        results.append(summarize("embed", size, measure(lambda: embedder.embed([ad], use_cache=False), repeat)))
+        results.append(summarize("embed_cached", size, measure(lambda: embedder.embed([ad]), repeat)))
+
+        query = embedder.embed([ad])[0].tolist()
+        retrieved = retrieve(vector_store.get_collection(), query, k=k)
+        results.append(summarize("retrieve", size,
+                                 measure(lambda: retrieve(vector_store.get_collection(), query, k=k), repeat)))
+        if vector_store.RETRIEVAL_CONFIG["backend"] == "numpy":
+            index = vector_store.get_index()
+            results.append(summarize("retrieve_numpy", size,
+                                     measure(lambda: retrieve(index, query, k=k), repeat)))
+        lexical = vector_store.get_lexical_index()
+        if lexical is not None:
+            results.append(summarize("lexical_search", size, measure(lambda: lexical.search(ad, k), repeat)))
+            results.append(summarize("retrieve_hybrid", size,
+                                     measure(lambda: retrieve(vector_store.get_index(), query, k=k,
+                                                              query_text=ad, lexical=lexical), repeat)))
+        results.append(summarize("build_context", size, measure(lambda: build_context(retrieved), repeat)))
+
+        context = build_context(retrieved)
+        results.append(summarize("score_prompt", size, measure(lambda: score_prompt(context, ad), repeat)))
+
+        prompt = score_prompt(context, ad)
+        results.extend(bench_llm(model, prompt, repeat, size))
+        if model_path and concurrency > 1:
+            results.append(bench_concurrent(model, prompt, concurrency, repeat, size))
+
+        output = {"choices": [{"text": f"```json\n{STUB_OUTPUT}\n```\n" + synthetic_text(size)}]}
+        results.append(summarize("process_llm_output", size,
+                                 measure(lambda: process_llm_output(output, prompt), repeat)))
+    if model_path and draft_tokens:
+        results.append({"stage": "speculative", **model.speculative_stats()})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,200,800", help="ad sizes in words, comma separated")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--k", type=int, default=4, help="documents retrieved per query")
+    parser.add_argument("--model-path", default=None, help="GGUF file; stub model if omitted")
+    parser.add_argument("--draft-tokens", type=int, default=0, help="prompt-lookup speculative decoding")
+    parser.add_argument("--concurrency", type=int, default=1, help="simultaneous generations (llm_concurrent stage)")
+    parser.add_argument("--continuous-batching", action="store_true", help="serve them from one batched context")
+    parser.add_argument("--out", default="bench_results.json")
+    args = parser.parse_args()
+
+    # keep the benchmark's vector store away from the real one
+    os.environ["VECTOR_STORE_PATH"] = tempfile.mkdtemp(prefix="adalytics-bench-")
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(sizes, args.repeat, args.k, args.model_path, args.draft_tokens,
+                  args.concurrency, args.continuous_batching)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "model": os.path.basename(args.model_path) if args.model_path else "stub",
+            "repeat": args.repeat,
+            "k": args.k,
+            "draft_tokens": args.draft_tokens,
+            "concurrency": args.concurrency,
+            "continuous_batching": args.continuous_batching,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for row in results:
+        if "p50_ms" not in row:
+            print(f"{row['stage']:<28} {row}")
+            continue
+        extra = f"  {row['tokens_per_s']:.1f} tok/s" if "tokens_per_s" in row else ""
+        print(f"{row['stage']:<28} size={row['size']:<6} p50={row['p50_ms']:9.3f} ms  "
+              f"p95={row['p95_ms']:9.3f} ms{extra}")
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,83 @@ load_dotenv()
 
 DATA_PATH = Path(__file__).parent.parent / "data"
 
+# Persistent Chroma store + manifest of ingested document hashes
+VECTOR_STORE_PATH = Path(os.getenv("VECTOR_STORE_PATH", DATA_PATH / "vector_store"))
+VECTOR_STORE_BATCH_SIZE = int(os.getenv("VECTOR_STORE_BATCH_SIZE", 1000))
+
+# Ingestion (python -m back.src.rag.populate_db): PDF pages are extracted by
+# `workers` processes in ranges of `pages_per_task`, chunks embedded `embed_batch_size` at a time
+INGEST_CONFIG = {
+    "workers": int(os.getenv("INGEST_WORKERS", max(1, multiprocessing.cpu_count() - 1))),
+    "pages_per_task": int(os.getenv("INGEST_PAGES_PER_TASK", 16)),
+    "embed_batch_size": int(os.getenv("INGEST_EMBED_BATCH_SIZE", 256)),
+}
+
+# Chunking, in embedding-model tokens (all-MiniLM-L6-v2 truncates at 256)
+# dedupe_threshold: share of a chunk's 5-word shingles already seen above which it is dropped (0 disables)
+CHUNKER_CONFIG = {
+    "max_tokens": int(os.getenv("CHUNK_MAX_TOKENS", 200)),
+    "overlap_tokens": int(os.getenv("CHUNK_OVERLAP_TOKENS", 32)),
+    "dedupe_threshold": float(os.getenv("CHUNK_DEDUPE_THRESHOLD", 0.9)),
+}
+
+# Retrieval backend: "numpy" (exact top-k over a memory-mapped matrix shared by
+# all processes) or "chroma" (query the collection directly)
+# hybrid: fuse vector results with a BM25 index built at ingestion (reciprocal rank fusion, constant rrf_k)
+RETRIEVAL_CONFIG = {
+    "backend": os.getenv("RETRIEVAL_BACKEND", "numpy"),
+    "hybrid": os.getenv("RETRIEVAL_HYBRID", "1") == "1",
+    "rrf_k": int(os.getenv("RETRIEVAL_RRF_K", 60)),
+    "dtype": os.getenv("RETRIEVAL_DTYPE", "float32"),
+    "mmap": os.getenv("RETRIEVAL_MMAP", "1") == "1",
+}
+
+# Prompt context: `fetch_k` candidates are retrieved, then packed by MMR into
+# `token_budget` tokens; candidates with cosine >= max_similarity to a kept one are dropped
+CONTEXT_CONFIG = {
+    "fetch_k": int(os.getenv("CONTEXT_FETCH_K", 8)),
+    "token_budget": int(os.getenv("CONTEXT_TOKEN_BUDGET", 512)),
+    "mmr_lambda": float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7)),
+    "max_similarity": float(os.getenv("CONTEXT_MAX_SIMILARITY", 0.95)),
+}
+
 # Model configuration from environment variables
 # n_threads: CPU threads per model for inference (uses multiple cores via llama.cpp)
+# n_slots: llama.cpp contexts kept over the shared weights for concurrent use
+# prefix_cache_bytes: RAM budget for saved KV states of shared prompt prefixes (0 disables)
+# constrained: decode under a grammar built from each role's JSON output schema
+# continuous_batching: serve all requests from one llama.cpp context decoding up
+# to max_sequences sequences per batch (replaces the slots, prefix cache and speculative decoding)
 _default_threads = max(1, multiprocessing.cpu_count() - 1)
 MODEL_CONFIG = {
     "model_path": os.getenv("MODEL_PATH"),
     "n_ctx": 4096,
     "n_threads": int(os.getenv("N_THREADS", _default_threads)),
+    "n_slots": int(os.getenv("MODEL_SLOTS", 1)),
+    "prefix_cache_bytes": int(os.getenv("PREFIX_CACHE_BYTES", 1 << 30)),
+    "constrained": os.getenv("CONSTRAINED_DECODING", "1") == "1",
+    "continuous_batching": os.getenv("CONTINUOUS_BATCHING", "0") == "1",
+    "max_sequences": int(os.getenv("BATCH_MAX_SEQUENCES", 8)),
+}
+# concurrent generations one model can serve
+_model_capacity = MODEL_CONFIG["max_sequences"] if MODEL_CONFIG["continuous_batching"] else MODEL_CONFIG["n_slots"]
+
+# Speculative decoding per role: up to draft_tokens drafted by prompt lookup over
+# n-grams of draft_ngram tokens (0 disables). Drafting needs logits for every
+# position (n_ctx x n_vocab floats per slot), so a drafting role runs on its own
+# slots and those have no prefix cache: each saved state would carry the logits
+# too and a single one can exceed PREFIX_CACHE_BYTES. Trade-off: the role loses
+# the scorer -> critic prefix reuse (its prompt is prefilled in full) in
+# exchange for faster decoding; the other roles keep theirs.
+SPECULATIVE_CONFIG = {
+    "scorer": {
+        "draft_tokens": int(os.getenv("SCORER_DRAFT_TOKENS", 0)),
+        "draft_ngram": int(os.getenv("SCORER_DRAFT_NGRAM", 2)),
+    },
+    "critic": {
+        "draft_tokens": int(os.getenv("CRITIC_DRAFT_TOKENS", 0)),
+        "draft_ngram": int(os.getenv("CRITIC_DRAFT_NGRAM", 2)),
+    },
 }
 
 MODEL_ROUTING = {
@@ -23,6 +93,99 @@ MODEL_ROUTING = {
     "embedder": os.getenv("EMBEDDER_MODEL", "embedder_minilm"),
 }
 
-# def get_model_for_role(role: str) -> BaseModel:
-#     model_id = MODEL_ROUTING[role]
-#     return get_model(model_id)
\ No newline at end of file
+
+def _role_model_config(prefix: str, model_path: str) -> dict:
+    return {
+        **MODEL_CONFIG,
+        "model_path": model_path,
+        "n_ctx": int(os.getenv(f"{prefix}_N_CTX", MODEL_CONFIG["n_ctx"])),
+        "n_threads": int(os.getenv(f"{prefix}_N_THREADS", MODEL_CONFIG["n_threads"])),
+        "n_slots": int(os.getenv(f"{prefix}_MODEL_SLOTS", MODEL_CONFIG["n_slots"])),
+    }
+
+
+# Per-role models, built through the registry (MODEL_ROUTING ids). Each role
+# uses MODEL_CONFIG unless overridden by <ROLE>_MODEL_PATH (weights and thus
+# quantization), <ROLE>_N_CTX, <ROLE>_N_THREADS, <ROLE>_MODEL_SLOTS.
+# <ROLE>_FALLBACK_MODEL_PATH (same suffixes with <ROLE>_FALLBACK_) adds a
+# smaller model that takes requests when the role is overloaded
+ROLE_CONFIG = {}
+for _role in ("scorer", "critic"):
+    _prefix = _role.upper()
+    _fallback_path = os.getenv(f"{_prefix}_FALLBACK_MODEL_PATH")
+    ROLE_CONFIG[_role] = {
+        "model_id": MODEL_ROUTING[_role],
+        "model": {**_role_model_config(_prefix, os.getenv(f"{_prefix}_MODEL_PATH", MODEL_CONFIG["model_path"])),
+                  **SPECULATIVE_CONFIG[_role]},
+        "fallback": _role_model_config(f"{_prefix}_FALLBACK", _fallback_path) if _fallback_path else None,
+    }
+
+# Load-aware routing: a request goes to the fallback model when every slot of
+# the primary is busy and either more than max_queue_depth requests are waiting
+# for the scheduler or the primary's recent generations take over max_latency_s
+ROUTING_POLICY = {
+    "max_queue_depth": int(os.getenv("ROUTING_MAX_QUEUE_DEPTH", 2)),
+    "max_latency_s": float(os.getenv("ROUTING_MAX_LATENCY_S", 30)),
+}
+_fallback_slots = max((config["fallback"]["max_sequences"] if config["fallback"]["continuous_batching"]
+                       else config["fallback"]["n_slots"]) if config["fallback"] else 0
+                      for config in ROLE_CONFIG.values())
+
+# Inference scheduler: concurrent pipeline runs and bounded FIFO backlog
+# (by default as many as the primary and fallback slots can serve)
+SCHEDULER_CONFIG = {
+    "max_concurrency": int(os.getenv("INFERENCE_CONCURRENCY", _model_capacity + _fallback_slots)),
+    "max_queue": int(os.getenv("INFERENCE_QUEUE_SIZE", 16)),
+}
+
+# TTL (s) of cached service results (CacheProxy)
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+
+# GET /users pagination and /users/export streaming
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", 50))
+USERS_PAGE_MAX = int(os.getenv("USERS_PAGE_MAX", 200))
+USERS_EXPORT_BATCH_SIZE = int(os.getenv("USERS_EXPORT_BATCH_SIZE", 500))
+
+# Analysis history: write-behind buffer flushed to Postgres in multi-row inserts
+HISTORY_WRITER_CONFIG = {
+    "batch_size": int(os.getenv("HISTORY_BATCH_SIZE", 100)),
+    "flush_interval": float(os.getenv("HISTORY_FLUSH_INTERVAL", 1.0)),
+    "max_buffer": int(os.getenv("HISTORY_MAX_BUFFER", 10000)),
+}
+
+# Cache of complete analyses keyed by normalized input + models + prompt version
+ANALYSIS_CACHE_CONFIG = {
+    "ttl": int(os.getenv("ANALYSIS_CACHE_TTL", 86400)),
+    "max_entries": int(os.getenv("ANALYSIS_CACHE_SIZE", 256)),
+}
+
+# Batch analysis API: max ads per job and number of finished jobs kept in memory
+BATCH_CONFIG = {
+    "max_size": int(os.getenv("BATCH_MAX_SIZE", 1000)),
+    "max_jobs": int(os.getenv("BATCH_MAX_JOBS", 100)),
+}
+
+# Where inference runs: "local" (in the API process) or "redis" (back/archi/worker.py
+# processes consuming jobs from a Redis stream)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "local")
+WORKER_CONFIG = {
+    "jobs_stream": os.getenv("WORKER_JOBS_STREAM", "analysis:jobs"),
+    "results_prefix": os.getenv("WORKER_RESULTS_PREFIX", "analysis:results:"),
+    "group": os.getenv("WORKER_GROUP", "inference-workers"),
+    "concurrency": int(os.getenv("WORKER_CONCURRENCY", _model_capacity)),
+    "max_queue": int(os.getenv("WORKER_QUEUE_SIZE", 64)),
+    "result_ttl": int(os.getenv("WORKER_RESULT_TTL", 600)),
+    "timeout": int(os.getenv("WORKER_TIMEOUT", 300)),
+    # how long a job may wait for a worker before it is dropped from the queue
+    "queue_timeout": int(os.getenv("WORKER_QUEUE_TIMEOUT", 600)),
+    # jobs the whole worker tier runs at once (sum of the workers' concurrency)
+    "capacity": int(os.getenv("WORKER_CAPACITY", os.getenv("WORKER_CONCURRENCY", _model_capacity))),
+    "claim_idle_ms": int(os.getenv("WORKER_CLAIM_IDLE_MS", 600000)),
+}
+
+# Embedder: one resident model per process, concurrent calls share batches
+EMBEDDER_CONFIG = {
+    "max_batch_size": int(os.getenv("EMBED_MAX_BATCH_SIZE", 64)),
+    "max_wait_ms": float(os.getenv("EMBED_MAX_WAIT_MS", 5)),
+    "cache_size": int(os.getenv("EMBED_CACHE_SIZE", 1024)),
+}
@@ -1,47 +1,112 @@
 import json
 import time
 
-from back.src.rag.embedder import embed
-from back.src.rag.retriever import retrieve
+from back.config.config import CONTEXT_CONFIG
+from back.src.rag.embedder import embed, MODEL_NAME as EMBEDDER_MODEL
+from back.src.rag.retriever import retrieve, retrieve_batch
 from back.src.rag.indexer import build_context
-from back.src.rag.vector_store import collection
+from back.src.rag.vector_store import get_collection, get_index, get_lexical_index, refresh_index
 from back.src.utils import process_llm_output
+from back.src.metrics import observe
 from back.src.rag.populate_db import ensure_vector_store_populated
-from back.src.prompts.prompts import score_prompt, improve_prompt
+from back.src.prompts.prompts import score_prompt, improve_prompt, PROMPT_VERSION
 
 from back.app.database.schemas import TextEntry
 
+def pipeline_fingerprint(scorer_llm, critic_llm) -> dict:
+    """Models, sampling parameters and prompt version, used to key cached analyses."""
+    return {
+        "scorer": scorer_llm.fingerprint(),
+        "critic": critic_llm.fingerprint(),
+        "embedder": EMBEDDER_MODEL,
+        "prompt_version": PROMPT_VERSION,
+    }
+
+
+def _degraded(degraded: bool) -> dict:
+    # results of a fallback model are flagged (and never cached)
+    return {"degraded": True} if degraded else {}
+
+
 class Pipeline:
+    """
+    Stateless RAG + scorer/critic pipeline: everything request-specific is
+    passed to `run`, so one instance is safe to share across threads.
+    """
     def __init__(self, scorer_llm, critic_llm):
         self.scorer_llm = scorer_llm
         self.critic_llm = critic_llm
-        self.text_entry: TextEntry = None
-
-        ensure_vector_store_populated(collection)
 
-    def ingest(self, text_entry: TextEntry):
-        self.text_entry = text_entry
+        ensure_vector_store_populated(get_collection())
+        refresh_index()
 
+    def fingerprint(self) -> dict:
+        return pipeline_fingerprint(self.scorer_llm, self.critic_llm)
 
-    def build_context(self):
-        query_emb = embed([self.main_text])[0].tolist()
-        results = retrieve(collection, query_emb)
-        context = build_context(results)
+    def build_context(self, main_text: str) -> str:
+        with observe("embed"):
+            query_emb = embed([main_text])[0].tolist()
+        with observe("retrieve"):
+            results = retrieve(get_index(), query_emb, k=CONTEXT_CONFIG["fetch_k"],
+                               query_text=main_text, lexical=get_lexical_index())
+        with observe("build_context"):
+            context = build_context(results)
         return context
 
-    def run(self):
-        context = self.build_context()
+    def build_contexts(self, main_texts: list[str]) -> list[str]:
+        """Contexts for many ads: one encoder call and one vector-store query."""
+        query_embs = embed(main_texts).tolist()
+        batch = retrieve_batch(get_index(), query_embs, k=CONTEXT_CONFIG["fetch_k"],
+                               query_texts=main_texts, lexical=get_lexical_index())
+        return [build_context(results) for results in batch]
+
+    def run(self, text_entry: TextEntry, context: str = None):
+        main_text = text_entry.main_text
+        if context is None:
+            context = self.build_context(main_text)
         # Scorer: predict (non-streaming) -> raw dict
-        prompt_scorer = score_prompt(context, self.main_text)
-        out = self.scorer_llm.predict(prompt_scorer)
+        scorer, degraded = self.scorer_llm.route()
+        prompt_scorer = score_prompt(context, main_text)
+        out = scorer.predict(prompt_scorer)
         # Critic: predict (non-streaming)
         out = next(out)
-        out = process_llm_output(out, prompt_scorer)
-        yield json.dumps({"stage": "scorer", "result": out})
+        with observe("parse"):
+            out = process_llm_output(out, prompt_scorer)
+        yield json.dumps({"stage": "scorer", "result": out, **_degraded(degraded)})
 
-        prompt_critic = improve_prompt(context, self.main_text, out)
-        out2 = self.critic_llm.predict(prompt_critic)
+        critic, degraded = self.critic_llm.route()
+        prompt_critic = improve_prompt(context, main_text, out)
+        out2 = critic.predict(prompt_critic)
         out2 = next(out2)
-        out2 = process_llm_output(out2, prompt_critic)
-        yield json.dumps({"stage": "critic", "result": out2})
-    
+        with observe("parse"):
+            out2 = process_llm_output(out2, prompt_critic)
+        yield json.dumps({"stage": "critic", "result": out2, **_degraded(degraded)})
+
+    def stream(self, text_entry: TextEntry):
+        """
+        Same stages as `run`, but yields a frame per generated token
+        (`delta` + overall `progress`) and each stage result as soon as it
+        is parsed. Scorer covers progress 0-50, critic 50-100.
+        """
+        main_text = text_entry.main_text
+        context = self.build_context(main_text)
+
+        scorer, degraded = self.scorer_llm.route()
+        prompt_scorer = score_prompt(context, main_text)
+        out = None
+        for delta, progress, result in scorer.stream(prompt_scorer):
+            if result is None:
+                yield json.dumps({"stage": "scorer", "delta": delta, "progress": progress // 2})
+            else:
+                out = result
+        yield json.dumps({"stage": "scorer", "result": out, "progress": 50, **_degraded(degraded)})
+
+        critic, degraded = self.critic_llm.route()
+        prompt_critic = improve_prompt(context, main_text, out)
+        out2 = None
+        for delta, progress, result in critic.stream(prompt_critic):
+            if result is None:
+                yield json.dumps({"stage": "critic", "delta": delta, "progress": 50 + progress // 2})
+            else:
+                out2 = result
+        yield json.dumps({"stage": "critic", "result": out2, "progress": 100, **_degraded(degraded)})
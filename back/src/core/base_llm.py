@@ -1,10 +1,12 @@
 from abc import ABC, abstractmethod
 from typing import Any, Generator
-from back.src.utils import process_generated_text
+from back.src.utils import process_generated_text, JSONObjectScanner
+from back.src.metrics import observe
 
 class BaseModel(ABC):
     model_id: str  # e.g. "scorer_v1", "critic_v1", "embedder_minilm"
     streaming: bool = False
+    stop_at_json: bool = True  # stop decoding once the top-level JSON object is closed
     @abstractmethod
     def load(self) -> None:
         """Load weights / init client. No-op if already loaded."""
@@ -19,21 +21,39 @@ class BaseModel(ABC):
         """Sync inference."""
         pass
 
-    def stream(self, *args, **kwargs) -> Generator[Any, None, None]:
-        """Optional; default to wrapping predict."""
-        # Buffer all tokens and track progress
+    def route(self) -> tuple["BaseModel", bool]:
+        """Model that should serve the next request, and whether it is a degraded fallback."""
+        return self, False
+
+    def stream(self, prompt: str, **kwargs) -> Generator[tuple[str, int, Any], None, None]:
+        """
+        Yield (delta, progress, None) for every generated token, then
+        ("", 100, parsed_result) once generation is complete.
+        """
         generated_text = ""
         token_count = 0
-        for token in self.predict(*args, **kwargs):
-            print(token)
-            token_text = token["choices"][0]["text"]
-            generated_text += token_text
-            token_count += 1
-
-            progress = min(int((token_count / self.max_tokens) * 100), 99)  
-            
-            yield None, progress  
-        
+        scanner = JSONObjectScanner()
+        tokens = self.predict(prompt, stream=True, **kwargs)
+        try:
+            for token in tokens:
+                token_text = token["choices"][0]["text"]
+                generated_text += token_text
+                token_count += 1
+
+                progress = min(int((token_count / self.max_tokens) * 100), 99)
+
+                yield token_text, progress, None
+                if scanner.feed(token_text) and self.stop_at_json:
+                    break
+        finally:
+            # stops llama.cpp generation and releases the context, also when
+            # the caller closes this generator early
+            tokens.close()
+
         # When complete, parse and return the parsed JSON
-        parsed_result = process_generated_text(generated_text, self.prompt)
-        yield parsed_result, 100  # Final result with 100% progress
\ No newline at end of file
+        with observe("parse"):
+            if scanner.complete:
+                parsed_result = scanner.result()
+            else:
+                parsed_result = process_generated_text(generated_text, prompt)
+        yield "", 100, parsed_result  # Final result with 100% progress
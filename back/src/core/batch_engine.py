@@ -0,0 +1,313 @@
+import codecs
+import ctypes
+import itertools
+import threading
+from queue import Queue, Empty
+from typing import Dict, Iterator
+
+from back.src.metrics import BATCH_SEQUENCES
+
+
+class _Sequence:
+    """One generation request and its decoding state inside the engine."""
+    def __init__(self, prompt: str, max_tokens: int, temperature: float, grammar, stop: list[str], seed: int):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.grammar = grammar
+        self.stop = stop or []
+        self.seed = seed
+        self.out: Queue = Queue()
+        self.cancelled = False
+
+        self.seq_id = None
+        self.tokens: list[int] = []
+        self.sampler = None
+        self.n_past = 0        # tokens already in the KV cache
+        self.n_generated = 0
+        self.last_token = None  # sampled, not yet decoded
+        self.batch_index = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._text = ""
+        self._emitted = 0
+
+    @property
+    def prefilling(self) -> bool:
+        return self.n_past < len(self.tokens)
+
+    def push(self, piece: bytes) -> bool:
+        """Add a generated piece and emit the text now known to be final. True if a stop string matched."""
+        # a character split across tokens is held by the decoder until complete
+        self._text += self._decoder.decode(piece)
+        for stop in self.stop:
+            position = self._text.find(stop, max(0, self._emitted - len(stop)))
+            if position != -1:
+                self._text = self._text[:position]
+                self._emit(len(self._text))
+                return True
+        # hold back what could still be the start of a stop string
+        holdback = max((len(stop) - 1 for stop in self.stop), default=0)
+        self._emit(len(self._text) - holdback)
+        return False
+
+    def _emit(self, upto: int):
+        if upto > self._emitted:
+            self.out.put({"choices": [{"text": self._text[self._emitted:upto], "finish_reason": None}]})
+            self._emitted = upto
+
+    def finish(self, finish_reason: str):
+        self._text += self._decoder.decode(b"", final=True)
+        self._emit(len(self._text))
+        self.out.put({"choices": [{"text": "", "finish_reason": finish_reason}]})
+        self.out.put(None)
+
+
+class BatchEngine:
+    """
+    Continuous batching over one llama.cpp context holding up to
+    `max_sequences` sequences, each with its own `n_ctx` worth of KV cache.
+    A single thread runs the decode loop: every step puts the next token of
+    each running sequence and as much pending prompt as fits in `n_batch`
+    into one `llama_decode`, then samples each sequence with its own sampler
+    chain (temperature, grammar). Requests join when a sequence id is free
+    and leave at any token boundary (end of generation, max tokens, stop
+    string, or the consumer closing its generator), so the CPU works on one
+    wide batch instead of many single-sequence ones.
+    """
+    def __init__(self, model_path: str, n_ctx: int = 4096, n_threads: int = 4,
+                 max_sequences: int = 8, n_batch: int = 512):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.max_sequences = max(1, max_sequences)
+        self.n_batch = max(n_batch, self.max_sequences)
+        self._model = None
+        self._ctx = None
+        self._batch = None
+        self._incoming: Queue = Queue()
+        self._wakeup = threading.Event()
+        self._active: list[_Sequence] = []
+        self._free_ids = list(range(self.max_sequences))
+        self._seeds = itertools.count(1)
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def load(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            import llama_cpp
+            from llama_cpp._internals import LlamaModel, LlamaContext, LlamaBatch
+
+            llama_cpp.llama_backend_init()
+            model_params = llama_cpp.llama_model_default_params()
+            model_params.use_mmap = True
+            model = LlamaModel(path_model=self.model_path, params=model_params, verbose=False)
+
+            ctx_params = llama_cpp.llama_context_default_params()
+            ctx_params.n_ctx = self.n_ctx * self.max_sequences
+            ctx_params.n_batch = self.n_batch
+            ctx_params.n_ubatch = self.n_batch
+            ctx_params.n_seq_max = self.max_sequences
+            ctx_params.n_threads = self.n_threads
+            ctx_params.n_threads_batch = self.n_threads
+            self._ctx = LlamaContext(model=model, params=ctx_params, verbose=False)
+            self._batch = LlamaBatch(n_tokens=self.n_batch, embd=0, n_seq_max=1, verbose=False)
+            self._model = model
+            self._worker = threading.Thread(target=self._run, name="llama-batch-engine", daemon=True)
+            self._worker.start()
+
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def running(self) -> int:
+        return len(self._active)
+
+    def saturated(self) -> bool:
+        return len(self._active) + self._incoming.qsize() >= self.max_sequences
+
+    def generate(self, prompt: str, max_tokens: int = 200, temperature: float = 0.2,
+                 grammar=None, stop: list[str] = None, seed: int = None) -> Iterator[dict]:
+        """
+        Stream completion chunks shaped like `Llama(..., stream=True)` ones.
+        Closing the generator cancels the request at the next token.
+        """
+        self.load()
+        seq = _Sequence(prompt, max_tokens, temperature, grammar, stop,
+                        next(self._seeds) if seed is None else seed)
+        self._incoming.put(seq)
+        self._wakeup.set()
+        try:
+            while True:
+                chunk = seq.out.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            seq.cancelled = True
+
+    # everything below runs on the engine thread only
+
+    def _sampler(self, seq: _Sequence):
+        from llama_cpp._internals import LlamaSampler
+        sampler = LlamaSampler()
+        if seq.grammar is not None:
+            sampler.add_grammar(self._model, seq.grammar)
+        if seq.temperature <= 0:
+            sampler.add_greedy()
+        else:
+            # same chain and defaults as Llama.create_completion
+            sampler.add_top_k(40)
+            sampler.add_top_p(0.95, 1)
+            sampler.add_min_p(0.05, 1)
+            sampler.add_temp(seq.temperature)
+            sampler.add_dist(seq.seed)
+        return sampler
+
+    def _piece(self, token: int) -> bytes:
+        import llama_cpp
+        buffer = ctypes.create_string_buffer(64)
+        n = llama_cpp.llama_token_to_piece(self._model.vocab, token, buffer, len(buffer), 0, False)
+        return buffer.raw[:max(n, 0)]
+
+    def _admit(self):
+        while self._free_ids:
+            try:
+                seq = self._incoming.get_nowait()
+            except Empty:
+                return
+            if seq.cancelled:
+                continue
+            try:
+                seq.tokens = self._model.tokenize(seq.prompt.encode("utf-8"), add_bos=True, special=True)
+                if len(seq.tokens) >= self.n_ctx:
+                    raise ValueError(f"Prompt of {len(seq.tokens)} tokens exceeds n_ctx={self.n_ctx}")
+                seq.max_tokens = min(seq.max_tokens, self.n_ctx - len(seq.tokens))
+                seq.sampler = self._sampler(seq)
+            except Exception as e:
+                seq.out.put(e)
+                continue
+            seq.seq_id = self._free_ids.pop()
+            self._active.append(seq)
+
+    def _release(self, seq: _Sequence, finish_reason: str = None, error: Exception = None):
+        self._ctx.kv_cache_seq_rm(seq.seq_id, -1, -1)
+        self._active.remove(seq)
+        self._free_ids.append(seq.seq_id)
+        if seq.sampler is not None:
+            seq.sampler.close()
+        if error is not None:
+            seq.out.put(error)
+        else:
+            seq.finish(finish_reason)
+
+    def _add(self, token: int, pos: int, seq_id: int, logits: bool):
+        batch = self._batch.batch
+        i = batch.n_tokens
+        batch.token[i] = token
+        batch.pos[i] = pos
+        batch.seq_id[i][0] = seq_id
+        batch.n_seq_id[i] = 1
+        batch.logits[i] = logits
+        batch.n_tokens += 1
+        return i
+
+    def _step(self):
+        for seq in [seq for seq in self._active if seq.cancelled]:
+            self._release(seq, "stop")
+        if not self._active:
+            return
+
+        self._batch.reset()
+        for seq in self._active:
+            seq.batch_index = None
+        decoding = [seq for seq in self._active if not seq.prefilling]
+        for seq in decoding:
+            seq.batch_index = self._add(seq.last_token, seq.n_past, seq.seq_id, True)
+            seq.n_past += 1
+        # prompts fill what is left of the batch, oldest request first
+        budget = self.n_batch - len(decoding)
+        for seq in self._active:
+            if not seq.prefilling or budget <= 0:
+                continue
+            chunk = seq.tokens[seq.n_past:seq.n_past + budget]
+            for offset, token in enumerate(chunk):
+                last = seq.n_past + offset == len(seq.tokens) - 1
+                index = self._add(token, seq.n_past + offset, seq.seq_id, last)
+                if last:
+                    seq.batch_index = index
+            seq.n_past += len(chunk)
+            budget -= len(chunk)
+
+        BATCH_SEQUENCES.set(len(self._active))
+        try:
+            self._ctx.decode(self._batch)
+        except Exception as e:
+            for seq in list(self._active):
+                self._release(seq, error=e)
+            return
+
+        import llama_cpp
+        for seq in list(self._active):
+            if seq.batch_index is None:
+                continue
+            token = seq.sampler.sample(self._ctx, seq.batch_index)
+            seq.batch_index = None
+            seq.n_generated += 1
+            if llama_cpp.llama_vocab_is_eog(self._model.vocab, token):
+                self._release(seq, "stop")
+            elif seq.push(self._piece(token)):
+                self._release(seq, "stop")
+            elif seq.n_generated >= seq.max_tokens:
+                self._release(seq, "length")
+            else:
+                seq.last_token = token
+
+    def _fail_all(self, error: Exception):
+        """Hand `error` to every running and waiting request so no caller blocks forever."""
+        for seq in list(self._active):
+            try:
+                self._release(seq, error=error)
+            except Exception:
+                # its KV cache may be left behind, never its caller
+                if seq in self._active:
+                    self._active.remove(seq)
+                    self._free_ids.append(seq.seq_id)
+                seq.out.put(error)
+        while True:
+            try:
+                self._incoming.get_nowait().out.put(error)
+            except Empty:
+                break
+
+    def _run(self):
+        while True:
+            if not self._active:
+                # idle: block until a request arrives
+                BATCH_SEQUENCES.set(0)
+                self._wakeup.wait()
+                self._wakeup.clear()
+            try:
+                self._admit()
+                self._step()
+            except Exception as e:
+                # the loop must survive: later requests get a working engine
+                print(f"Batch engine step failed: {e}")
+                self._fail_all(e)
+
+
+_ENGINES: Dict[tuple, BatchEngine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+def get_batch_engine(model_path: str, n_ctx: int, n_threads: int, max_sequences: int = 8) -> BatchEngine:
+    """One engine per (path, n_ctx, n_threads): roles over the same weights share its batch."""
+    key = (model_path, n_ctx, n_threads)
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = BatchEngine(model_path, n_ctx, n_threads, max_sequences)
+            _ENGINES[key] = engine
+        return engine
@@ -1,69 +1,234 @@
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+
 from .base_llm import BaseModel
-from llama_cpp import Llama
-from .model_factory import register_model
+from .model_factory import register_model, get_model_pool
+from .batch_engine import get_batch_engine
+from back.src.utils import JSONObjectScanner
+from back.src.metrics import record_generation, record_speculation
+from back.src.prompts.prompts import SCORE_SCHEMA, IMPROVE_SCHEMA
 
 
-@register_model("scorer_v1")
-class ScorerV1(BaseModel):
-    model_id = "scorer_v1"
-    def __init__(self, model_path: str, n_ctx: int = 4096, n_threads: int = 4):
-        self._llm = None
+@lru_cache(maxsize=None)
+def compile_grammar(schema_json: str):
+    """GBNF grammar for a JSON schema, compiled once per schema."""
+    from llama_cpp import LlamaGrammar
+    return LlamaGrammar.from_json_schema(schema_json, verbose=False)
+
+
+class LocalLlama(BaseModel):
+    """
+    llama.cpp role over a shared `ModelPool`. Roles using the same weights and
+    context settings share the pool and only differ by sampling parameters.
+    With `constrained=True` generation follows a grammar built from the role's
+    `output_schema`, so the output is JSON in the expected shape; the schema's
+    string limits keep a complete object within `max_tokens`.
+    With `draft_tokens > 0` decoding is speculative: up to that many tokens
+    are drafted by prompt lookup (n-grams of `draft_ngram` tokens matched in
+    the prompt and output so far) and verified in one batch, which pays off
+    when the output copies the prompt, as the critic's rewrite does. Greedy
+    output is unchanged. Drafting needs logits for every position, so the
+    role gets its own pool, without prefix cache.
+    With `continuous_batching=True` the role generates through a shared
+    `BatchEngine` instead of the slot pool: concurrent requests decode
+    together in one multi-sequence batch (no prefix cache, no speculative
+    decoding in that mode).
+    """
+    max_tokens: int = 200
+    temperature: float = 0.2
+    output_schema: dict = None
+
+    def __init__(self, model_path: str, n_ctx: int = 4096, n_threads: int = 4, n_slots: int = 1,
+                 prefix_cache_bytes: int = 0, constrained: bool = False,
+                 draft_tokens: int = 0, draft_ngram: int = 2,
+                 continuous_batching: bool = False, max_sequences: int = 8):
+        self._pool = None
+        self._engine = None
         self._path = model_path
         self._n_ctx = n_ctx
         self._n_threads = n_threads
-        self.max_tokens = 200
-        self.temperature = 0.2
+        self._n_slots = n_slots
+        self._prefix_cache_bytes = prefix_cache_bytes
+        self.constrained = constrained and self.output_schema is not None
+        self.draft_tokens = draft_tokens
+        self.draft_ngram = draft_ngram
+        self._logits_all = draft_tokens > 0
+        self.continuous_batching = continuous_batching
+        self._max_sequences = max_sequences
+        self._drafted = 0
+        self._accepted = 0
+        self._latency = 0.0
+        self._stats_lock = threading.Lock()
 
     def load(self):
-        self._llm = Llama(self._path, 
-                          n_ctx=self._n_ctx, 
-                          n_threads=self._n_threads)
+        if self.continuous_batching:
+            if self._engine is None:
+                self._engine = get_batch_engine(self._path, self._n_ctx, self._n_threads, self._max_sequences)
+            self._engine.load()
+            return
+        if self._pool is None:
+            self._pool = get_model_pool(self._path, self._n_ctx, self._n_threads,
+                                        self._n_slots, self._prefix_cache_bytes,
+                                        self._logits_all)
+        self._pool.load()
 
     def is_loaded(self):
-        return self._llm is not None
+        if self._engine is not None:
+            return self._engine.is_loaded()
+        return self._pool is not None and self._pool.is_loaded()
 
-    def predict(self, prompt: str, **kwargs):
-        output = self._llm(
-            prompt,
-            max_tokens=self.max_tokens,
-            temperature=self.temperature,
-            stream=self.streaming
-        )
-        if self.streaming:
-            yield from output
-        else:
-            yield output
+    def fingerprint(self) -> dict:
+        """Everything about this role that changes its output for a given prompt."""
+        return {
+            "model_id": self.model_id,
+            "weights": os.path.basename(self._path or ""),
+            "n_ctx": self._n_ctx,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "constrained": self.constrained,
+        }
 
+    def grammar(self):
+        if not self.constrained:
+            return None
+        return compile_grammar(json.dumps(self.output_schema, sort_keys=True))
 
+    def cache_stats(self) -> dict:
+        """Prefix KV cache counters of the shared pool (empty if disabled)."""
+        return self._pool.cache_stats() if self._pool is not None else {}
 
-@register_model("critic_v1")
-class CriticV1(BaseModel):
-    model_id = "critic_v1"
-    def __init__(self, model_path: str, n_ctx: int = 4096, n_threads: int = 4):
-        self._llm = None
-        self._path = model_path
-        self._n_ctx = n_ctx
-        self._n_threads = n_threads
-        self.max_tokens = 200
-        self.temperature = 0.3
+    def saturated(self) -> bool:
+        if self._engine is not None:
+            return self._engine.saturated()
+        return self._pool is not None and self._pool.saturated()
 
-    def load(self):
-        self._llm = Llama(self._path, 
-                          n_ctx=self._n_ctx, 
-                          n_threads=self._n_threads)
+    def latency(self) -> float:
+        """Moving average of the duration of recent generations, in seconds."""
+        return self._latency
 
-    def is_loaded(self):
-        return self._llm is not None
-
-    def predict(self, prompt: str, **kwargs):
-        output = self._llm(
-            prompt,
-            max_tokens=self.max_tokens,
-            temperature=self.temperature,
-            stream=self.streaming,
-        )
-        if self.streaming:
-            yield from output
-        else:
-            yield output
+    def speculative_stats(self) -> dict:
+        """Drafted / accepted token counts since start (empty if not speculative)."""
+        if self.draft_tokens <= 0 or self.continuous_batching:
+            return {}
+        with self._stats_lock:
+            return {
+                "drafted": self._drafted,
+                "accepted": self._accepted,
+                "acceptance_rate": self._accepted / self._drafted if self._drafted else 0.0,
+            }
 
+    def predict(self, prompt: str, stream: bool = None, **kwargs):
+        stream = self.streaming if stream is None else stream
+        if self._engine is not None:
+            output = self._timed(self._engine.generate(
+                prompt,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                grammar=self.grammar()
+            ))
+            if stream:
+                yield from output
+            else:
+                yield self._collect(output)
+            return
+        # llama.cpp always streams so prefill/decode can be timed and decoding
+        # stopped early; the slot is released before yielding a complete
+        # output, so a caller that only takes `next()` does not keep it busy
+        with self._pool.acquire() as llm:
+            drafter = None
+            if self.draft_tokens > 0:
+                from .speculative import CountingPromptLookup
+                # fresh drafter per generation so its counts are this call's
+                drafter = CountingPromptLookup(self.draft_ngram, self.draft_tokens)
+            # set on every call: roles sharing the pool may draft differently
+            llm.draft_model = drafter
+            output = self._timed(self._save_on_close(llm, llm(
+                prompt,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                grammar=self.grammar(),
+                stream=True
+            )), drafter)
+            if stream:
+                yield from output
+                return
+            output = self._collect(output)
+        yield output
+
+    @staticmethod
+    def _save_on_close(llm, chunks):
+        """
+        llama.cpp stores the slot's KV state in its cache only once a stream is
+        exhausted. Stopping at the closing brace closes it before that, so the
+        state reached so far (prompt and generated tokens) is saved here.
+        """
+        started = False
+        try:
+            for chunk in chunks:
+                started = True
+                yield chunk
+        except GeneratorExit:
+            chunks.close()
+            if started and llm.cache is not None:
+                llm.cache[llm.input_ids[:llm.n_tokens].tolist()] = llm.save_state()
+            raise
+
+    def _timed(self, chunks, drafter=None):
+        start = time.perf_counter()
+        first = None
+        n_tokens = 0
+        try:
+            for chunk in chunks:
+                if first is None:
+                    first = time.perf_counter()
+                n_tokens += 1
+                yield chunk
+        finally:
+            chunks.close()
+            end = time.perf_counter()
+            first = first or end
+            record_generation(self.model_id, first - start, end - first, n_tokens)
+            with self._stats_lock:
+                self._latency = end - start if self._latency == 0 else 0.8 * self._latency + 0.2 * (end - start)
+            if drafter is not None:
+                self._record_speculation(drafter.drafted, drafter.accepted)
+
+    def _record_speculation(self, drafted: int, accepted: int):
+        with self._stats_lock:
+            self._drafted += drafted
+            self._accepted += accepted
+        record_speculation(self.model_id, drafted, accepted)
+
+    def _collect(self, chunks) -> dict:
+        """
+        Join streamed chunks into one completion, up to the closing brace of
+        the JSON object when `stop_at_json` is set.
+        """
+        scanner = JSONObjectScanner()
+        finish_reason = "length"
+        for chunk in chunks:
+            if scanner.feed(chunk["choices"][0]["text"]) and self.stop_at_json:
+                finish_reason = "stop"
+                break
+            finish_reason = chunk["choices"][0].get("finish_reason") or finish_reason
+        chunks.close()
+        return {"choices": [{"text": scanner.text, "finish_reason": finish_reason}]}
+
+
+@register_model("scorer_v1")
+class ScorerV1(LocalLlama):
+    model_id = "scorer_v1"
+    max_tokens = 200
+    temperature = 0.2
+    output_schema = SCORE_SCHEMA
+
+
+@register_model("critic_v1")
+class CriticV1(LocalLlama):
+    model_id = "critic_v1"
+    max_tokens = 200
+    temperature = 0.3
+    output_schema = IMPROVE_SCHEMA
@@ -1,3 +1,6 @@
+import threading
+from contextlib import contextmanager
+from queue import Queue, Empty
 from typing import Dict, Type
 from .base_llm import BaseModel
 
@@ -15,3 +18,104 @@ def create_model(model_id: str, **kwargs) -> BaseModel:
         raise KeyError(f"Unknown model: {model_id}")
     return _REGISTRY[model_id](**kwargs)
 
+
+class ModelPool:
+    """
+    Context slots over one set of GGUF weights. Slots are created lazily up
+    to `n_slots`; weights are memory-mapped so extra slots only add their own
+    KV cache. `acquire` blocks until a slot is free. With `prefix_cache_bytes`
+    set, all slots share a `PrefixCache` of saved KV states. With `logits_all`
+    set, slots keep logits for every position (n_ctx x n_vocab floats each),
+    which lets roles attach a speculative drafter per generation; such a pool
+    has no prefix cache, since every saved state would carry those logits.
+    """
+    def __init__(self, model_path: str, n_ctx: int, n_threads: int, n_slots: int = 1,
+                 prefix_cache_bytes: int = 0, logits_all: bool = False):
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+        self.n_slots = max(1, n_slots)
+        self.logits_all = logits_all
+        self.prefix_cache_bytes = 0 if logits_all else prefix_cache_bytes
+        self.prefix_cache = None
+        self._free: Queue = Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_slot(self):
+        from llama_cpp import Llama
+        llm = Llama(self.model_path,
+                    n_ctx=self.n_ctx,
+                    n_threads=self.n_threads,
+                    use_mmap=True,
+                    logits_all=self.logits_all,
+                    verbose=False)
+        if self.prefix_cache_bytes > 0:
+            if self.prefix_cache is None:
+                from .prefix_cache import PrefixCache
+                self.prefix_cache = PrefixCache(self.prefix_cache_bytes)
+            llm.set_cache(self.prefix_cache.bind(llm))
+        return llm
+
+    def cache_stats(self) -> dict:
+        return self.prefix_cache.stats() if self.prefix_cache is not None else {}
+
+    def load(self):
+        """Make sure at least one slot (and thus the weights) is resident."""
+        with self._lock:
+            if self._created == 0:
+                self._free.put(self._new_slot())
+                self._created += 1
+
+    def is_loaded(self) -> bool:
+        return self._created > 0
+
+    @property
+    def in_use(self) -> int:
+        return self._created - self._free.qsize()
+
+    def saturated(self) -> bool:
+        """Every slot is busy: a new request would wait."""
+        return self.in_use >= self.n_slots
+
+    @contextmanager
+    def acquire(self):
+        try:
+            llm = self._free.get_nowait()
+        except Empty:
+            llm = None
+            with self._lock:
+                if self._created < self.n_slots:
+                    self._created += 1
+                    try:
+                        llm = self._new_slot()
+                    except Exception:
+                        self._created -= 1
+                        raise
+            if llm is None:
+                llm = self._free.get()
+        try:
+            yield llm
+        finally:
+            self._free.put(llm)
+
+
+_POOLS: Dict[tuple, ModelPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_model_pool(model_path: str, n_ctx: int, n_threads: int, n_slots: int = 1,
+                   prefix_cache_bytes: int = 0, logits_all: bool = False) -> ModelPool:
+    """
+    One pool per (path, n_ctx, n_threads, logits_all): roles over the same
+    weights and settings share it and its prefix cache; speculative roles get
+    their own, without a prefix cache.
+    """
+    key = (model_path, n_ctx, n_threads, logits_all)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = ModelPool(model_path, n_ctx, n_threads, n_slots, prefix_cache_bytes, logits_all)
+            _POOLS[key] = pool
+        else:
+            pool.n_slots = max(pool.n_slots, n_slots)
+        return pool
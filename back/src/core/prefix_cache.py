@@ -0,0 +1,96 @@
+import threading
+
+from llama_cpp import Llama, LlamaRAMCache
+
+from back.src.metrics import record_cache, record_prefix_reuse, PREFIX_CACHE_BYTES
+
+
+class PrefixCache(LlamaRAMCache):
+    """
+    llama.cpp RAM state cache shared by every slot of a `ModelPool`.
+    Entries are keyed by token sequence and looked up by longest common
+    prefix, evicted LRU once `capacity_bytes` is exceeded. Prefixes shorter
+    than `min_prefix_tokens` (a BOS or a few template tokens) are not worth
+    loading a saved state for and are reported as misses.
+    A lookup only counts as a hit when the restored prefix is longer than
+    what the slot's live KV cache already holds, since llama.cpp skips the
+    load otherwise; the tokens saved are the difference.
+    """
+    def __init__(self, capacity_bytes: int, min_prefix_tokens: int = 32):
+        super().__init__(capacity_bytes=capacity_bytes)
+        self.min_prefix_tokens = min_prefix_tokens
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.tokens_looked_up = 0
+        self.tokens_reused = 0
+
+    def bind(self, llm: Llama) -> "_SlotCache":
+        """The cache as seen by one slot, to pass to `llm.set_cache`."""
+        return _SlotCache(self, llm)
+
+    def lookup(self, key, live_prefix: int = 0):
+        key = tuple(key)
+        with self._lock:
+            self.lookups += 1
+            self.tokens_looked_up += len(key)
+            found = self._find_longest_prefix_key(key)
+            reused = Llama.longest_token_prefix(found, key) if found is not None else 0
+            hit = reused >= self.min_prefix_tokens and reused > live_prefix
+            saved = reused - live_prefix if hit else 0
+            self.hits += hit
+            self.tokens_reused += saved
+            record_cache("prefix_kv", hit)
+            record_prefix_reuse(len(key), saved)
+            if reused < self.min_prefix_tokens:
+                raise KeyError("Key not found")
+            value = self.cache_state[found]
+            self.cache_state.move_to_end(found)
+            return value
+
+    def __getitem__(self, key):
+        return self.lookup(key)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._find_longest_prefix_key(tuple(key)) is not None
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            PREFIX_CACHE_BYTES.set(self.cache_size)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "prefill_tokens_saved": self.tokens_reused,
+                "prefill_tokens_saved_per_request": (
+                    self.tokens_reused / self.lookups if self.lookups else 0.0
+                ),
+                "prefill_saved_ratio": (
+                    self.tokens_reused / self.tokens_looked_up if self.tokens_looked_up else 0.0
+                ),
+                "entries": len(self.cache_state),
+                "size_bytes": self.cache_size,
+                "capacity_bytes": self.capacity_bytes,
+            }
+
+
+class _SlotCache:
+    """`PrefixCache` view of one slot: lookups know how much of the prompt its KV cache already holds."""
+    def __init__(self, cache: PrefixCache, llm: Llama):
+        self.cache = cache
+        self.llm = llm
+
+    def __getitem__(self, key):
+        live = self.llm.input_ids[:self.llm.n_tokens].tolist()
+        return self.cache.lookup(key, Llama.longest_token_prefix(live, tuple(key)))
+
+    def __contains__(self, key) -> bool:
+        return key in self.cache
+
+    def __setitem__(self, key, value):
+        self.cache[key] = value
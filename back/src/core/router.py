@@ -0,0 +1,66 @@
+from typing import Callable
+
+from back.config.config import ROLE_CONFIG, ROUTING_POLICY
+from .base_llm import BaseModel
+from .model_factory import create_model
+from . import local_llm  # noqa: F401  registers the llama.cpp roles
+
+
+class RoutedModel(BaseModel):
+    """
+    One pipeline role served by a primary model and an optional smaller
+    fallback. `route` picks the fallback only when every slot of the primary
+    is busy and the role is overloaded: more than `max_queue_depth` requests
+    waiting (`queue_depth`) or primary generations slower than
+    `max_latency_s` on average. Everything else (fingerprint, sampling
+    parameters, stats) is the primary's, so cached analyses stay keyed on it.
+    """
+    def __init__(self, primary: BaseModel, fallback: BaseModel = None,
+                 queue_depth: Callable[[], int] = None,
+                 max_queue_depth: int = 2, max_latency_s: float = 30):
+        self.primary = primary
+        self.fallback = fallback
+        self.queue_depth = queue_depth or (lambda: 0)
+        self.max_queue_depth = max_queue_depth
+        self.max_latency_s = max_latency_s
+
+    def __getattr__(self, name):
+        # model_id, max_tokens, cache_stats, ... of the primary
+        if name == "primary":
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    def load(self):
+        self.primary.load()
+        if self.fallback is not None:
+            self.fallback.load()
+
+    def is_loaded(self) -> bool:
+        return self.primary.is_loaded()
+
+    def overloaded(self) -> bool:
+        return self.queue_depth() > self.max_queue_depth or self.primary.latency() > self.max_latency_s
+
+    def route(self) -> tuple[BaseModel, bool]:
+        if (self.fallback is not None and self.fallback.is_loaded()
+                and self.primary.saturated() and self.overloaded()):
+            return self.fallback, True
+        return self.primary, False
+
+    def predict(self, prompt: str, stream: bool = None, **kwargs):
+        model, _ = self.route()
+        return model.predict(prompt, stream=stream, **kwargs)
+
+    def stream(self, prompt: str, **kwargs):
+        model, _ = self.route()
+        return model.stream(prompt, **kwargs)
+
+
+def build_role(role: str, queue_depth: Callable[[], int] = None) -> RoutedModel:
+    """Primary (and fallback) model of a role, created through the registry from ROLE_CONFIG."""
+    config = ROLE_CONFIG[role]
+    primary = create_model(config["model_id"], **config["model"])
+    fallback = None
+    if config["fallback"] is not None:
+        fallback = create_model(config["model_id"], **config["fallback"])
+    return RoutedModel(primary, fallback, queue_depth, **ROUTING_POLICY)
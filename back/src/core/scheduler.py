@@ -0,0 +1,126 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from back.src.metrics import STAGE_SECONDS
+
+
+class SchedulerBusy(Exception):
+    """Raised when the inference queue is full; carries a retry hint in seconds."""
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after} s")
+        self.retry_after = retry_after
+
+
+class InferenceScheduler:
+    """
+    Admission control in front of blocking inference calls.
+    At most `max_concurrency` jobs run at once on a dedicated thread pool,
+    up to `max_queue` more wait in FIFO order, anything beyond that is
+    rejected immediately with `SchedulerBusy`.
+    """
+    def __init__(self, max_concurrency: int = 1, max_queue: int = 16):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix="inference")
+        self._semaphore = None
+        self._waiting = 0
+        self._running = 0
+        self._avg_duration = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def retry_after(self) -> int:
+        avg = self._avg_duration if self._avg_duration is not None else 10.0
+        return max(1, math.ceil(avg * (self._waiting + 1) / self.max_concurrency))
+
+    def _finish(self, start: float):
+        duration = time.monotonic() - start
+        if self._avg_duration is None:
+            self._avg_duration = duration
+        else:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        self._running -= 1
+        self._semaphore.release()
+
+    async def submit(self, fn, *args):
+        if self._waiting >= self.max_queue:
+            raise SchedulerBusy(self.retry_after())
+        if self._semaphore is None:
+            # asyncio.Semaphore wakes waiters in FIFO order
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self._waiting += 1
+        queued_at = time.monotonic()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        STAGE_SECONDS.labels("queue_wait").observe(time.monotonic() - queued_at)
+
+        self._running += 1
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, fn, *args)
+        # release the slot when the job really ends, not when the caller gives up
+        future.add_done_callback(lambda _: self._finish(start))
+        return await asyncio.shield(future)
+
+    async def stream(self, fn, *args):
+        """
+        Run the blocking generator function `fn` under the same admission
+        control as `submit`, yielding its items as soon as they are produced.
+        Closing this generator (the consumer left) cancels the job: a queued
+        one never starts, a running one stops at its next item, which closes
+        `fn`'s generator so llama.cpp stops and the slot is released.
+        """
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        done = object()
+        cancel = threading.Event()
+
+        def drain():
+            if cancel.is_set():
+                loop.call_soon_threadsafe(items.put_nowait, done)
+                return
+            generator = fn(*args)
+            try:
+                for item in generator:
+                    if cancel.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+            finally:
+                generator.close()
+                loop.call_soon_threadsafe(items.put_nowait, done)
+
+        job = asyncio.ensure_future(self.submit(drain))
+        try:
+            while True:
+                if items.empty() and job.done():
+                    # rejected (SchedulerBusy) or failed before producing anything
+                    job.result()
+                    break
+                getter = asyncio.ensure_future(items.get())
+                await asyncio.wait({getter, job}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                item = getter.result()
+                if item is done:
+                    break
+                yield item
+            await job
+        finally:
+            cancel.set()
+            if not job.done():
+                # leaves the queue if still waiting; a running job stops on `cancel`
+                job.cancel()
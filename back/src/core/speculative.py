@@ -0,0 +1,38 @@
+from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+
+
+class CountingPromptLookup(LlamaPromptLookupDecoding):
+    """
+    Prompt-lookup drafter (proposes the tokens that followed the last n-gram
+    where it occurred earlier in the sequence) that counts, for one
+    generation, how many drafted tokens the model verified and accepted.
+
+    llama.cpp calls the drafter once per verification step with the sequence
+    kept so far plus the last sampled token, so the tokens accepted between
+    two calls are the growth of that sequence minus the one sampled token.
+    The drafts of the last call are never verified and are not counted.
+    """
+    def __init__(self, max_ngram_size: int = 2, num_pred_tokens: int = 10):
+        super().__init__(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens)
+        self.calls = 0
+        self.drafted = 0
+        self._first_length = 0
+        self._last_length = 0
+        self._last_draft = 0
+
+    def __call__(self, input_ids, /, **kwargs):
+        draft = super().__call__(input_ids, **kwargs)
+        if self.calls == 0:
+            self._first_length = len(input_ids)
+        else:
+            self.drafted += self._last_draft
+        self.calls += 1
+        self._last_length = len(input_ids)
+        self._last_draft = len(draft)
+        return draft
+
+    @property
+    def accepted(self) -> int:
+        if self.calls < 2:
+            return 0
+        return max(0, self._last_length - self._first_length - (self.calls - 1))
@@ -0,0 +1,115 @@
+"""
+Prometheus metrics shared by the API and the pipeline, exposed on `/metrics`.
+Observations are in-memory counter/bucket updates, cheap enough to stay on under load.
+"""
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+TPS_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+STAGE_SECONDS = Histogram(
+    "adalytics_stage_seconds",
+    "Latency of each pipeline stage (queue_wait, embed, retrieve, build_context, "
+    "<role>_prefill, <role>_decode, parse)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "adalytics_time_to_first_token_seconds",
+    "Time from the LLM call to its first generated token",
+    ["role"],
+    buckets=LATENCY_BUCKETS,
+)
+TOKENS_PER_SECOND = Histogram(
+    "adalytics_tokens_per_second",
+    "Decode throughput of one generation",
+    ["role"],
+    buckets=TPS_BUCKETS,
+)
+GENERATED_TOKENS = Counter(
+    "adalytics_generated_tokens_total",
+    "Tokens generated",
+    ["role"],
+)
+QUEUE_DEPTH = Gauge(
+    "adalytics_inference_queue_depth",
+    "Requests waiting for an inference slot",
+)
+INFERENCE_RUNNING = Gauge(
+    "adalytics_inference_running",
+    "Requests currently running inference",
+)
+BATCH_SEQUENCES = Gauge(
+    "adalytics_batch_sequences",
+    "Sequences in the continuous batching engine's running batch",
+)
+ACTIVE_WEBSOCKETS = Gauge(
+    "adalytics_active_websockets",
+    "Open websocket connections",
+)
+CACHE_REQUESTS = Counter(
+    "adalytics_cache_requests_total",
+    "Cache lookups by cache and result (hit/miss); hit ratio = hit / (hit + miss)",
+    ["cache", "result"],
+)
+SPECULATIVE_TOKENS = Counter(
+    "adalytics_speculative_tokens_total",
+    "Speculatively drafted tokens by result (drafted/accepted); acceptance rate = accepted / drafted",
+    ["role", "result"],
+)
+PREFIX_CACHE_TOKENS = Counter(
+    "adalytics_prefix_cache_tokens_total",
+    "Prompt tokens looked up in the prefix KV cache and tokens whose prefill a restored state "
+    "saved (looked_up/saved); saved ratio = saved / looked_up",
+    ["result"],
+)
+PREFIX_CACHE_BYTES = Gauge(
+    "adalytics_prefix_cache_bytes",
+    "Size of the saved KV states held by the prefix cache",
+)
+DB_QUERY_SECONDS = Histogram(
+    "adalytics_db_query_seconds",
+    "Latency of database statements",
+    buckets=DB_BUCKETS,
+)
+
+
+@contextmanager
+def observe(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_prefix_reuse(looked_up: int, saved: int):
+    PREFIX_CACHE_TOKENS.labels("looked_up").inc(looked_up)
+    PREFIX_CACHE_TOKENS.labels("saved").inc(saved)
+
+
+def record_generation(role: str, prefill_seconds: float, decode_seconds: float, n_tokens: int):
+    TIME_TO_FIRST_TOKEN.labels(role).observe(prefill_seconds)
+    STAGE_SECONDS.labels(f"{role}_prefill").observe(prefill_seconds)
+    STAGE_SECONDS.labels(f"{role}_decode").observe(decode_seconds)
+    GENERATED_TOKENS.labels(role).inc(n_tokens)
+    if decode_seconds > 0 and n_tokens > 1:
+        TOKENS_PER_SECOND.labels(role).observe((n_tokens - 1) / decode_seconds)
+
+
+def record_speculation(role: str, drafted: int, accepted: int):
+    SPECULATIVE_TOKENS.labels(role, "drafted").inc(drafted)
+    SPECULATIVE_TOKENS.labels(role, "accepted").inc(accepted)
+
+
+def render() -> tuple[bytes, str]:
+    """Body and content type of the Prometheus text exposition."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,11 +1,135 @@
-def chunk_text(text: str, size: int = 20, overlap: int = 10) -> list[str]:
-    words = text.split()
-    chunks = []
+import hashlib
+import re
+from typing import Callable, Iterable, Iterator
 
-    for i in range(0, len(words), size - overlap):
-        chunk = " ".join(words[i:i+size])
-        chunks.append(chunk)
+from back.config.config import CHUNKER_CONFIG
 
-    return chunks
+# Bump whenever chunk boundaries change, stored documents are then re-chunked
+CHUNKER_VERSION = "2"
 
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[A-Z0-9])")
+_WORD = re.compile(r"\w+", re.UNICODE)
 
+
+def estimate_tokens(text: str) -> int:
+    """Cheap stand-in for a tokenizer: word pieces are ~1.3 per word."""
+    return int(len(text.split()) * 1.3) + 1
+
+
+def split_sentences(paragraph: str) -> list[str]:
+    paragraph = " ".join(paragraph.split())
+    return [s for s in _SENTENCE_END.split(paragraph) if s]
+
+
+def _split_long(sentence: str, max_tokens: int, count_tokens: Callable[[str], int]) -> list[str]:
+    """Word windows for a single sentence longer than a whole chunk."""
+    words = sentence.split()
+    pieces, current = [], []
+    for word in words:
+        if current and count_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _shingles(text: str, n: int = 5) -> set[int]:
+    words = [w.lower() for w in _WORD.findall(text)]
+    if len(words) < n:
+        return {hash(tuple(words))} if words else set()
+    return {hash(tuple(words[i:i + n])) for i in range(len(words) - n + 1)}
+
+
+class _Deduplicator:
+    """
+    Drops exact duplicates (normalized text hash) and near-duplicates: chunks
+    whose word 5-shingles were almost all seen in earlier chunks, e.g. the
+    same disclaimer repeated on every page.
+    """
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self._digests = set()
+        self._shingles = set()
+
+    def is_duplicate(self, chunk: str) -> bool:
+        digest = hashlib.sha1(" ".join(_WORD.findall(chunk.lower())).encode("utf-8")).digest()
+        if digest in self._digests:
+            return True
+        self._digests.add(digest)
+        shingles = _shingles(chunk)
+        seen = len(shingles & self._shingles) / len(shingles) if shingles else 1.0
+        self._shingles |= shingles
+        return seen >= self.threshold
+
+
+def chunk_pages(pages: Iterable[str],
+                max_tokens: int = CHUNKER_CONFIG["max_tokens"],
+                overlap_tokens: int = CHUNKER_CONFIG["overlap_tokens"],
+                count_tokens: Callable[[str], int] = None,
+                dedupe_threshold: float = CHUNKER_CONFIG["dedupe_threshold"]) -> Iterator[str]:
+    """
+    Yield chunks of at most `max_tokens` tokens from a stream of pages.
+    Chunks are built from whole sentences and closed early at a paragraph
+    end once they are at least half full; the next chunk repeats up to
+    `overlap_tokens` of trailing sentences. Exact and near-duplicate chunks
+    are skipped. `count_tokens` defaults to a word-based estimate, pass the
+    embedding model's tokenizer to size chunks exactly.
+    """
+    count_tokens = count_tokens or estimate_tokens
+    dedupe = _Deduplicator(dedupe_threshold) if dedupe_threshold else None
+    current: list[tuple[str, int]] = []
+    current_tokens = 0
+    carried = 0  # leading sentences repeated from the previous chunk
+
+    def emit():
+        if len(current) <= carried:
+            return None
+        chunk = " ".join(sentence for sentence, _ in current)
+        if dedupe is None or not dedupe.is_duplicate(chunk):
+            return chunk
+        return None
+
+    def carry_overlap():
+        kept, tokens = [], 0
+        for sentence, n in reversed(current):
+            if tokens + n > overlap_tokens:
+                break
+            kept.insert(0, (sentence, n))
+            tokens += n
+        return kept, tokens
+
+    for page in pages:
+        for paragraph in _PARAGRAPH_BREAK.split(page):
+            for sentence in split_sentences(paragraph):
+                n = count_tokens(sentence)
+                parts = [(sentence, n)] if n <= max_tokens else \
+                    [(p, count_tokens(p)) for p in _split_long(sentence, max_tokens, count_tokens)]
+                for part, n in parts:
+                    if current and current_tokens + n > max_tokens:
+                        chunk = emit()
+                        if chunk:
+                            yield chunk
+                        current, current_tokens = carry_overlap()
+                        if current_tokens + n > max_tokens:
+                            current, current_tokens = [], 0
+                        carried = len(current)
+                    current.append((part, n))
+                    current_tokens += n
+            if current and current_tokens >= max_tokens // 2:
+                chunk = emit()
+                if chunk:
+                    yield chunk
+                # a paragraph is a natural break, no overlap across it
+                current, current_tokens, carried = [], 0, 0
+
+    if current:
+        chunk = emit()
+        if chunk:
+            yield chunk
+
+
+def chunk_text(text: str, **kwargs) -> Iterator[str]:
+    return chunk_pages([text], **kwargs)
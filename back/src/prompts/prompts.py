@@ -1,14 +1,63 @@
-def score_prompt(context: str, ad_text: str) -> str:
+# Bump whenever a template changes, it is part of the analysis cache key
+PROMPT_VERSION = "3"
+
+# JSON schemas of the output formats below, used for constrained decoding.
+# llama.cpp's grammar converter ignores minimum/maximum, so scores are an enum.
+# String lengths (in characters, ~4 per token) keep a complete object within
+# the roles' max_tokens=200, so generation cannot stop inside a string.
+_SCORE = {"enum": list(range(11))}
+
+SCORE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "clarity": _SCORE,
+        "brand_alignment": _SCORE,
+        "compliance": _SCORE,
+        "conversion": _SCORE,
+        "justification": {"type": "string", "maxLength": 400},
+    },
+    "required": ["clarity", "brand_alignment", "compliance", "conversion", "justification"],
+    "additionalProperties": False,
+}
+
+IMPROVE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "suggestions": {
+            "type": "array",
+            "items": {"type": "string", "maxLength": 120},
+            "minItems": 3,
+            "maxItems": 3,
+        },
+        "new_ad": {"type": "string", "maxLength": 280},
+    },
+    "required": ["suggestions", "new_ad"],
+    "additionalProperties": False,
+}
+
+
+def shared_prefix(context: str, ad_text: str) -> str:
+    """
+    Static instructions + retrieved context + ad, identical for the scorer and
+    the critic so the KV state of this prefix can be reused between them.
+    """
     prompt = f"""
-                You are an expert ad evaluator.
+                You are an expert advertising assistant.
                 Use ONLY the context.
-                Return JSON. 
+                Return JSON.
 
                 Context:
                 {context}
 
                 Ad:
                 {ad_text}
+"""
+    return prompt
+
+
+def score_prompt(context: str, ad_text: str) -> str:
+    prompt = shared_prefix(context, ad_text) + f"""
+                Task: evaluate the ad as an expert ad evaluator.
 
                 Output format:
                 {{
@@ -23,28 +72,20 @@ def score_prompt(context: str, ad_text: str) -> str:
 
 
 def improve_prompt(context: str, ad_text: str, scores: str) -> str:
-    prompt = f"""
-                You are a marketing consultant.
-                Use the context and scores to improve the ad:
-                1. Suggest 3 improvements as suggestions
-                2. Rewrite the ad as a new_ad
-                Return JSON.
-
-                Context:
-                {context}
-
+    prompt = shared_prefix(context, ad_text) + f"""
                 Scores:
                 {scores}
 
-                Ad:
-                {ad_text}
+                Task: as a marketing consultant, use the context and scores to improve the ad:
+                1. Suggest 3 improvements as suggestions
+                2. Rewrite the ad as a new_ad
 
                 Output format:
                 {{
                     "suggestions": ["...", "...", "..."],
                     "new_ad": "..."
                 }}
-                
 
-                """ 
-    return prompt
\ No newline at end of file
+
+                """
+    return prompt
@@ -1,8 +1,137 @@
-from sentence_transformers import SentenceTransformer
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+import numpy as np
 from numpy import ndarray
+
+from back.config.config import EMBEDDER_CONFIG
+from back.src.utils import LRUCache
+
 MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
 
-def embed(texts: list[str], model_name: str = MODEL_NAME) -> ndarray:
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(texts)
-    return embeddings
\ No newline at end of file
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Embedder:
+    """
+    Resident SentenceTransformer. The model is loaded once, concurrent
+    `embed` calls are gathered by a background thread into shared encoder
+    batches, and query embeddings are kept in an LRU cache keyed by text hash.
+    """
+    def __init__(self,
+                 model_name: str = MODEL_NAME,
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 5,
+                 cache_size: int = 1024):
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache = LRUCache(cache_size)
+        self._model = None
+        self._queue: Queue = Queue()
+        self._worker = None
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        with self._load_lock:
+            if self._model is None:
+                # imported here so torch is only loaded when the model is
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._batch_loop,
+                                                name="embedder-batcher",
+                                                daemon=True)
+                self._worker.start()
+
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def dimension(self) -> int:
+        self.load()
+        return self._model.get_sentence_embedding_dimension()
+
+    def count_tokens(self, text: str) -> int:
+        """Length of `text` in the model's own word pieces, special tokens excluded."""
+        self.load()
+        return len(self._model.tokenizer.tokenize(text))
+
+    def embed(self, texts: list[str], use_cache: bool = True) -> ndarray:
+        self.load()
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        vectors = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            cached = self.cache.get(text_hash(text)) if use_cache else None
+            if cached is None:
+                missing.append(i)
+            else:
+                vectors[i] = cached
+
+        if missing:
+            future = Future()
+            self._queue.put(([texts[i] for i in missing], future))
+            encoded = future.result()
+            for i, vec in zip(missing, encoded):
+                vectors[i] = vec
+                if use_cache:
+                    # a copy: a row view would keep the whole batch array alive
+                    self.cache.put(text_hash(texts[i]), vec.copy())
+
+        return np.stack(vectors)
+
+    def _collect_batch(self) -> list[tuple[list[str], Future]]:
+        # block for the first request, then wait a short window for others
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                encoded = self._model.encode(texts, batch_size=self.max_batch_size)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(encoded[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+
+_embedders: dict[str, Embedder] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(model_name: str = MODEL_NAME) -> Embedder:
+    with _embedders_lock:
+        if model_name not in _embedders:
+            _embedders[model_name] = Embedder(model_name, **EMBEDDER_CONFIG)
+        return _embedders[model_name]
+
+
+def embed(texts: list[str], model_name: str = MODEL_NAME, use_cache: bool = True) -> ndarray:
+    return get_embedder(model_name).embed(texts, use_cache=use_cache)
@@ -1,6 +1,92 @@
-def build_context(results: dict) -> str:
+from typing import Callable
+
+import numpy as np
+
+from back.config.config import CONTEXT_CONFIG
+from back.src.preprocessing.chunker import estimate_tokens, split_sentences
+
+
+def _merge_overlapping(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping the sentences `second` repeats from `first`."""
+    sentences = split_sentences(second)
+    for n in range(len(sentences), 0, -1):
+        if first.endswith(" ".join(sentences[:n])):
+            return " ".join([first] + sentences[n:])
+    return f"{first} {second}"
+
+
+def select_chunks(results: dict,
+                  token_budget: int = CONTEXT_CONFIG["token_budget"],
+                  mmr_lambda: float = CONTEXT_CONFIG["mmr_lambda"],
+                  max_similarity: float = CONTEXT_CONFIG["max_similarity"],
+                  count_tokens: Callable[[str], int] = estimate_tokens) -> list[int]:
+    """
+    Indices of the retrieved chunks to keep, picked by maximal marginal
+    relevance: relevance comes from the returned distances, redundancy from
+    the returned embeddings. Chunks closer than `max_similarity` to one
+    already picked are dropped, as are chunks that no longer fit in the
+    token budget.
+    """
+    documents = results["documents"][0]
+    if not documents:
+        return []
+    distances = np.asarray(results["distances"][0], dtype=np.float32)
+    # squared L2 between unit vectors is 2 - 2 cos
+    relevance = 1.0 - distances / 2.0
+    embeddings = results.get("embeddings")
+    if embeddings is not None and len(embeddings[0]) == len(documents):
+        vectors = np.asarray(embeddings[0], dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ vectors.T
+    else:
+        similarity = np.zeros((len(documents), len(documents)), dtype=np.float32)
+
+    selected, used = [], 0
+    remaining = list(range(len(documents)))
+    while remaining and used < token_budget:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = int(np.argmax(scores))
+        i = remaining.pop(best)
+        if redundancy[best] >= max_similarity:
+            continue
+        tokens = count_tokens(documents[i])
+        if used + tokens > token_budget:
+            continue
+        selected.append(i)
+        used += tokens
+    return selected
+
+
+def build_context(results: dict, token_budget: int = CONTEXT_CONFIG["token_budget"], **kwargs) -> str:
+    """
+    Pack the retrieved chunks into at most `token_budget` tokens: redundant
+    chunks are filtered out (see `select_chunks`) and consecutive chunks of
+    the same source are merged into one passage.
+    """
+    selected = select_chunks(results, token_budget=token_budget, **kwargs)
+    documents = results["documents"][0]
+    metadatas = results["metadatas"][0]
+
+    # passages in order of their best chunk, chunks of a passage in document order
+    passages = []
+    for i in sorted(selected, key=lambda i: (metadatas[i]["source"], metadatas[i].get("chunk", -1))):
+        meta = metadatas[i]
+        last = passages[-1] if passages else None
+        if (last is not None and "chunk" in meta and last["source"] == meta["source"]
+                and last["chunk"] == meta["chunk"] - 1):
+            last["text"] = _merge_overlapping(last["text"], documents[i])
+            last["chunk"] = meta["chunk"]
+            last["rank"] = min(last["rank"], selected.index(i))
+        else:
+            passages.append({"source": meta["source"], "chunk": meta.get("chunk"),
+                             "text": documents[i], "rank": selected.index(i)})
+    passages.sort(key=lambda passage: passage["rank"])
+
     context = ""
-    for i, doc in enumerate(results["documents"][0]):
-        source = results["metadatas"][0][i]["source"]
-        context += f"[{i+1}] {doc}\n(Source: {source})\n\n"
-    return context
\ No newline at end of file
+    for i, passage in enumerate(passages):
+        context += f"[{i+1}] {passage['text']}\n(Source: {passage['source']})\n\n"
+    return context
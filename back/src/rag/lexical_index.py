@@ -0,0 +1,82 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index over the stored chunks with BM25 weights precomputed at
+    build time, so a query is a few dict lookups and additions. Terms found
+    in more than `max_df` of the chunks of a large corpus carry almost no
+    signal and are left out, which keeps postings short for ad-length queries.
+    """
+    def __init__(self, postings: dict[str, dict[int, float]], ids: list[str], version: str = None):
+        self.postings = postings
+        self.ids = ids
+        self.version = version
+
+    @classmethod
+    def build(cls, ids: list[str], documents: list[str], k1: float = 1.2, b: float = 0.75,
+              max_df: float = 0.5, version: str = None) -> "BM25Index":
+        term_counts = [Counter(tokenize(doc)) for doc in documents]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        n_docs = len(documents)
+        avg_length = sum(lengths) / n_docs if n_docs else 0.0
+
+        doc_freq = Counter()
+        for counts in term_counts:
+            doc_freq.update(counts.keys())
+
+        idf = {term: math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+               for term, df in doc_freq.items()
+               # small corpora keep every term
+               if n_docs < 100 or df <= max_df * n_docs}
+        postings: dict[str, dict[int, float]] = {term: {} for term in idf}
+        for doc, (counts, length) in enumerate(zip(term_counts, lengths)):
+            norm = k1 * (1 - b + b * length / avg_length) if avg_length else k1
+            for term, tf in counts.items():
+                if term in idf:
+                    postings[term][doc] = idf[term] * tf * (k1 + 1) / (tf + norm)
+        return cls(postings, list(ids), version)
+
+    @classmethod
+    def from_collection(cls, collection, version: str = None, **kwargs) -> "BM25Index":
+        data = collection.get(include=["documents"])
+        return cls.build(data["ids"], data["documents"], version=version, **kwargs)
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # per process: two processes may build the same version at once
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "ids": self.ids,
+                       "postings": {term: [[doc, weight] for doc, weight in docs.items()]
+                                    for term, docs in self.postings.items()}}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {term: {doc: weight for doc, weight in docs} for term, docs in data["postings"].items()}
+        return cls(postings, data["ids"], data["version"])
+
+    def search(self, text: str, k: int = 4) -> list[tuple[str, float]]:
+        """(chunk id, BM25 score) of the k best matching chunks, best first."""
+        scores: dict[int, float] = {}
+        for term in set(tokenize(text)):
+            for doc, weight in self.postings.get(term, {}).items():
+                scores[doc] = scores.get(doc, 0.0) + weight
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.ids[doc], score) for doc, score in best]
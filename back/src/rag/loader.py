@@ -2,12 +2,17 @@ from pypdf import PdfReader
 from back.config.config import DATA_PATH
 import os
 
-def load_pdf(path: str) -> list[str]:
+def count_pdf_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+def extract_pdf_pages(path: str, start: int = 0, stop: int = None) -> list[str]:
+    """Text of pages [start, stop), run in worker processes during ingestion."""
     reader = PdfReader(path)
-    pages = []
-    for i, page in enumerate(reader.pages):
-        pages.append(f"Page {i+1}: {page.extract_text()}")
-    return pages
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    return [f"Page {i+1}: {reader.pages[i].extract_text()}" for i in range(start, stop)]
+
+def load_pdf(path: str) -> list[str]:
+    return extract_pdf_pages(path)
 
 def load_md(path: str) -> str:
     with open(path, "r", encoding="utf-8") as f:
@@ -20,4 +25,4 @@ if __name__ == "__main__":
     pages = load_pdf(os.path.join(DATA_PATH, "shampoo-ad.pdf"))
     print(pages)
     # # md = load_md("data/ad.md")
-    # # print(md)
\ No newline at end of file
+    # # print(md)
@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+
+class NumpyIndex:
+    """
+    Exact in-process vector index. Normalized embeddings live in one
+    contiguous float32 (or float16) matrix, top-k is one matrix product plus
+    `argpartition`. Saved as a .npy file it is memory-mapped on load, so every
+    process on the host shares the same pages.
+
+    Exposes the subset of the Chroma collection API `retrieve` uses (`query`,
+    `count`), with distances as squared L2 between unit vectors (2 - 2 cos),
+    like Chroma's default space.
+    """
+    def __init__(self, embeddings: np.ndarray, documents: list[str], metadatas: list[dict],
+                 ids: list[str], version: str = None):
+        self._matrix = embeddings
+        self.documents = documents
+        self.metadatas = metadatas
+        self.ids = ids
+        self.version = version
+        self._id_positions = None
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    @classmethod
+    def from_collection(cls, collection, dtype=np.float32, version: str = None) -> "NumpyIndex":
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+        if embeddings.size == 0:
+            embeddings = embeddings.reshape(0, 0)
+        matrix = np.ascontiguousarray(cls._normalize(embeddings), dtype=dtype)
+        return cls(matrix, list(data["documents"]), list(data["metadatas"]), list(data["ids"]), version)
+
+    def save(self, path: Path):
+        """
+        Written to a temporary directory then renamed to `path`, so files other
+        processes may have mapped are never rewritten. If another process
+        saved the same index first, its copy is kept.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(prefix=f".{path.name}.", dir=path.parent))
+        try:
+            np.save(tmp_path / "embeddings.npy", self._matrix)
+            with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "ids": self.ids,
+                           "documents": self.documents, "metadatas": self.metadatas}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # the target exists and is not empty: another process won the race
+            if not (path / "meta.json").exists():
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> "NumpyIndex":
+        path = Path(path)
+        matrix = np.load(path / "embeddings.npy", mmap_mode="r" if mmap else None)
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(matrix, meta["documents"], meta["metadatas"], meta["ids"], meta["version"])
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get(self, ids: list[str] = None, include=("documents", "metadatas"), **_) -> dict:
+        """Rows by id, like `Collection.get` (unknown ids are left out)."""
+        if ids is None:
+            rows = list(range(len(self.ids)))
+        else:
+            positions = self._positions()
+            rows = [positions[id_] for id_ in ids if id_ in positions]
+        results = {"ids": [self.ids[i] for i in rows]}
+        if "documents" in include:
+            results["documents"] = [self.documents[i] for i in rows]
+        if "metadatas" in include:
+            results["metadatas"] = [self.metadatas[i] for i in rows]
+        if "embeddings" in include:
+            results["embeddings"] = np.asarray(self._matrix[rows], dtype=np.float32)
+        return results
+
+    def _positions(self) -> dict[str, int]:
+        if self._id_positions is None:
+            self._id_positions = {id_: i for i, id_ in enumerate(self.ids)}
+        return self._id_positions
+
+    def top_k(self, query_embeddings, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """(indices, similarities) of the k nearest rows for each query, best first."""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if self.count() == 0 or k == 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(int), empty.astype(np.float32)
+        queries = self._normalize(queries)
+        sims = queries.astype(self._matrix.dtype) @ self._matrix.T
+        k = min(k, sims.shape[1])
+        if k < sims.shape[1]:
+            candidates = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(k), (len(queries), 1))
+        candidate_sims = np.take_along_axis(sims, candidates, axis=1)
+        order = np.argsort(-candidate_sims, axis=1)
+        return (np.take_along_axis(candidates, order, axis=1),
+                np.take_along_axis(candidate_sims, order, axis=1).astype(np.float32))
+
+    def query(self, query_embeddings, n_results: int = 4, include=("distances", "documents", "metadatas"),
+              **_) -> dict:
+        indices, sims = self.top_k(query_embeddings, n_results)
+        results = {"ids": [[self.ids[i] for i in row] for row in indices]}
+        if "distances" in include:
+            results["distances"] = (2.0 - 2.0 * sims).tolist()
+        if "documents" in include:
+            results["documents"] = [[self.documents[i] for i in row] for row in indices]
+        if "metadatas" in include:
+            results["metadatas"] = [[self.metadatas[i] for i in row] for row in indices]
+        if "embeddings" in include:
+            results["embeddings"] = [np.asarray(self._matrix[row], dtype=np.float32) for row in indices]
+        return results
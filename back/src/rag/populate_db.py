@@ -1,29 +1,284 @@
+"""
+Incremental ingestion of the documents under DATA_PATH into the vector store:
+
+    python -m back.src.rag.populate_db
+    python -m back.src.rag.populate_db --root path/to/docs --workers 8
+
+PDF pages are extracted in a process pool, streamed through the chunker and
+embedded in batches; a document is recorded in the manifest only once all
+its chunks are stored, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+
+from back.config.config import DATA_PATH, VECTOR_STORE_PATH, INGEST_CONFIG, CHUNKER_CONFIG
+from .loader import count_pdf_pages, extract_pdf_pages, load_md
+from back.src.preprocessing.chunker import chunk_pages, CHUNKER_VERSION
+from .embedder import embed, get_embedder, MODEL_NAME as EMBEDDER_MODEL
+from .vector_store import add_chunks, delete_source, load_manifest, save_manifest, refresh_index
+
+EXTENSIONS = (".pdf", ".md")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ingest_signature() -> str:
+    """
+    Digest of what turns a document into stored chunks: chunker version and
+    settings, embedder model. Part of every manifest entry, so changing any
+    of them re-ingests every document (and thus rebuilds the indexes).
+    """
+    payload = json.dumps({"chunker": CHUNKER_VERSION, **CHUNKER_CONFIG, "embedder": EMBEDDER_MODEL},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
 
-from back.config.config import DATA_PATH
-from .loader import load_pdf
-from back.src.preprocessing.chunker import chunk_text
-from .embedder import embed
-from .vector_store import add_chunks
+def source_name(path: Path) -> str:
+    """
+    Source (manifest key and chunk metadata) of a document: its path relative
+    to DATA_PATH when it lives there, its absolute path otherwise, so
+    documents ingested from different roots never collide.
+    """
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(DATA_PATH.resolve()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def source_path(source: str) -> Path:
+    # an absolute source stays as is
+    return DATA_PATH / source
+
+
+def discover_documents(root: Path = DATA_PATH) -> list[str]:
+    """Sources of every PDF and Markdown file under `root`."""
+    root = Path(root)
+    vector_store = VECTOR_STORE_PATH.resolve()
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # never descend into the vector store itself
+        dirnames[:] = sorted(d for d in dirnames if Path(dirpath, d).resolve() != vector_store)
+        for filename in sorted(filenames):
+            if filename.lower().endswith(EXTENSIONS):
+                sources.append(source_name(Path(dirpath, filename)))
+    return sources
+
+
+class Ingestor:
+    """
+    Page extraction fans out to worker processes in ranges of
+    `pages_per_task`, with at most `max_pending` ranges in flight across
+    documents (the next PDFs are extracted while the current one is
+    embedded), and results are consumed in document order so chunks and ids
+    stay deterministic. Memory holds a bounded number of pages and one embedding
+    batch, whatever the size of the corpus.
+    """
+    def __init__(self, root: Path = DATA_PATH,
+                 workers: int = INGEST_CONFIG["workers"],
+                 pages_per_task: int = INGEST_CONFIG["pages_per_task"],
+                 embed_batch_size: int = INGEST_CONFIG["embed_batch_size"]):
+        self.root = Path(root)
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.embed_batch_size = embed_batch_size
+        self.max_pending = max(2, workers * 2)
+        self.pages = 0
+        self.chunks = 0
+        self._tasks = iter(())
+        self._pending = deque()
 
+    def _page_ranges(self, sources: list[str]):
+        for source in sources:
+            path = str(source_path(source))
+            try:
+                n_pages = count_pdf_pages(path)
+            except Exception as e:
+                # raised when the document's turn comes, not the current one's
+                yield source, e
+                continue
+            for start in range(0, n_pages, self.pages_per_task):
+                yield source, (path, start, start + self.pages_per_task)
 
-def populate_vector_store():
-    pdf_name = "shampoo-ad.pdf"
-    pages = load_pdf(os.path.join(DATA_PATH, pdf_name))
-    full_text = "\n\n".join(pages)
-    chunks = chunk_text(full_text)
-    embeddings = embed(chunks).tolist()
-    metadata = [{"id": f"chunk_{i}", "source": pdf_name} for i in range(len(chunks))]
-    add_chunks(chunks, embeddings, metadata)
+    def _fill(self, pool):
+        while len(self._pending) < self.max_pending:
+            task = next(self._tasks, None)
+            if task is None:
+                return
+            source, args = task
+            if isinstance(args, Exception):
+                future = Future()
+                future.set_exception(args)
+            else:
+                future = pool.submit(extract_pdf_pages, *args)
+            self._pending.append((source, future))
+
+    def _discard(self, source: str):
+        """Drop the page ranges of a failed document, in flight or not yet submitted."""
+        while self._pending and self._pending[0][0] == source:
+            _, future = self._pending.popleft()
+            future.cancel()
+        self._tasks = itertools.dropwhile(lambda task: task[0] == source, self._tasks)
+
+    def _iter_pages(self, source: str, pool):
+        """Pages of one document, extracted ahead by the pool."""
+        if source.lower().endswith(".md"):
+            yield load_md(str(source_path(source)))
+            return
+        if pool is None:
+            yield from extract_pdf_pages(str(source_path(source)))
+            return
+        self._fill(pool)
+        while self._pending and self._pending[0][0] == source:
+            _, future = self._pending.popleft()
+            self._fill(pool)
+            yield from future.result()
+
+    def _store(self, source: str, doc_hash: str, offset: int, chunks: list[str]):
+        embeddings = embed(chunks, use_cache=False).tolist()
+        metadata = [{"id": f"{source}:chunk_{offset + i}", "source": source,
+                     "doc_hash": doc_hash, "chunk": offset + i}
+                    for i in range(len(chunks))]
+        add_chunks(chunks, embeddings, metadata)
+
+    def ingest_document(self, source: str, doc_hash: str, pool=None) -> int:
+        # drop chunks of the previous version (or of an interrupted run) first
+        delete_source(source)
+        count_tokens = get_embedder().count_tokens
+        n_chunks, batch = 0, []
+
+        def pages():
+            for page in self._iter_pages(source, pool):
+                self.pages += 1
+                yield page
+
+        for chunk in chunk_pages(pages(), count_tokens=count_tokens):
+            batch.append(chunk)
+            if len(batch) >= self.embed_batch_size:
+                self._store(source, doc_hash, n_chunks, batch)
+                n_chunks += len(batch)
+                batch = []
+        if batch:
+            self._store(source, doc_hash, n_chunks, batch)
+            n_chunks += len(batch)
+        self.chunks += n_chunks
+        return n_chunks
+
+    def run(self, collection=None) -> int:
+        manifest = load_manifest()
+        if collection is not None and collection.count() == 0:
+            # store was wiped, the manifest no longer describes it
+            manifest = {}
+
+        sources = discover_documents(self.root)
+        signature = ingest_signature()
+        todo = []
+        for source in sources:
+            try:
+                doc_hash = file_hash(str(source_path(source)))
+            except OSError as e:
+                print(f"Skipped {source}: {e}")
+                continue
+            if manifest.get(source) != f"{doc_hash}:{signature}":
+                todo.append((source, doc_hash))
+
+        # only documents under the scanned root can have disappeared from it
+        root = self.root.resolve()
+        scanned = {source for source in manifest if source_path(source).resolve().is_relative_to(root)}
+        for source in scanned - set(sources):
+            delete_source(source)
+            del manifest[source]
+            save_manifest(manifest)
+            print(f"Removed {source} from vector store.")
+
+        if not todo:
+            return 0
+
+        start = time.perf_counter()
+        pool = None
+        if self.workers > 1 and any(source.lower().endswith(".pdf") for source, _ in todo):
+            # spawn: the server calls this from a thread, forking it is unsafe
+            pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._tasks = self._page_ranges([source for source, _ in todo if source.lower().endswith(".pdf")])
+            self._pending = deque()
+        failed = 0
+        try:
+            for n, (source, doc_hash) in enumerate(todo, 1):
+                try:
+                    n_chunks = self.ingest_document(source, doc_hash, pool)
+                except Exception as e:
+                    # one unreadable document must not stop the others; it is
+                    # left out of the manifest so the next run retries it
+                    print(f"[{n}/{len(todo)}] Skipped {source}: {e}")
+                    failed += 1
+                    self._discard(source)
+                    delete_source(source)
+                    if manifest.pop(source, None) is not None:
+                        save_manifest(manifest)
+                    continue
+                manifest[source] = f"{doc_hash}:{signature}"
+                save_manifest(manifest)
+                elapsed = time.perf_counter() - start
+                print(f"[{n}/{len(todo)}] Ingested {source}: {n_chunks} chunks "
+                      f"({self.pages / elapsed:.1f} pages/s, {self.chunks / elapsed:.1f} chunks/s)")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+                self._tasks, self._pending = iter(()), deque()
+        return len(todo) - failed
+
+
+def populate_vector_store(collection=None, root: Path = DATA_PATH, **kwargs) -> int:
+    """
+    Embed only the documents under `root` that are new or whose content
+    changed since the last run, according to the manifest of content hashes,
+    and drop the ones that disappeared from it. Documents that cannot be read
+    are skipped. Returns the number of documents (re)ingested.
+    """
+    return Ingestor(root, **kwargs).run(collection)
 
 
 def ensure_vector_store_populated(collection):
     """
-    Check if collection is empty and populate it with ad.pdf if needed
+    Bring the persistent collection in sync with the documents on disk,
+    re-embedding only new or changed ones.
     """
-    count = collection.count()
-    if count == 0:
-        populate_vector_store()
-        print(f"Added chunks to vector store.")
+    ingested = populate_vector_store(collection)
+    if ingested:
+        print(f"Added chunks of {ingested} document(s) to vector store.")
     else:
-        print(f"Vector store already populated with {count} documents.")
\ No newline at end of file
+        print(f"Vector store up to date with {collection.count()} documents.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", type=Path, default=DATA_PATH, help="directory scanned for .pdf and .md files")
+    parser.add_argument("--workers", type=int, default=INGEST_CONFIG["workers"], help="PDF extraction processes")
+    parser.add_argument("--pages-per-task", type=int, default=INGEST_CONFIG["pages_per_task"])
+    parser.add_argument("--embed-batch-size", type=int, default=INGEST_CONFIG["embed_batch_size"])
+    args = parser.parse_args()
+
+    ingestor = Ingestor(args.root, args.workers, args.pages_per_task, args.embed_batch_size)
+    start = time.perf_counter()
+    ingested = ingestor.run()
+    refresh_index()
+    elapsed = time.perf_counter() - start
+    print(f"Ingested {ingested} document(s), {ingestor.pages} pages, {ingestor.chunks} chunks in {elapsed:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
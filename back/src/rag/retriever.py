@@ -1,8 +1,76 @@
+import numpy as np
 
-def retrieve(collection, query_embedding: list[float], k: int = 4) -> dict:
+from back.config.config import RETRIEVAL_CONFIG
+
+INCLUDE = ["distances", "documents", "metadatas", "embeddings"]
+FIELDS = ["ids", "distances", "documents", "metadatas", "embeddings"]
+
+
+def fuse(collection, lexical, query_embedding: list[float], query_text: str, results: dict,
+         k: int = 4, rrf_k: int = RETRIEVAL_CONFIG["rrf_k"]) -> dict:
+    """
+    Reciprocal rank fusion of the vector results of one query with the BM25
+    hits for its text, in the same shape `retrieve` returns. Chunks only the
+    lexical side found are fetched from the collection and get their
+    distance to the query computed here.
+    """
+    vector_ids = results["ids"][0]
+    lexical_ids = [id_ for id_, _ in lexical.search(query_text, k)]
+    scores = {}
+    for ranking in (vector_ids, lexical_ids):
+        for rank, id_ in enumerate(ranking):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (rrf_k + rank + 1)
+    fused = sorted(scores, key=scores.get, reverse=True)[:k]
+
+    rows = {id_: {field: results[field][0][i] for field in FIELDS}
+            for i, id_ in enumerate(vector_ids)}
+    missing = [id_ for id_ in fused if id_ not in rows]
+    if missing:
+        extra = collection.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        for i, id_ in enumerate(extra["ids"]):
+            embedding = np.asarray(extra["embeddings"][i], dtype=np.float32)
+            cosine = float(query @ embedding) / max(float(np.linalg.norm(embedding)), 1e-12)
+            rows[id_] = {"ids": id_, "distances": 2.0 - 2.0 * cosine, "documents": extra["documents"][i],
+                         "metadatas": extra["metadatas"][i], "embeddings": embedding}
+
+    fused = [id_ for id_ in fused if id_ in rows]
+    return {field: [[rows[id_][field] for id_ in fused]] for field in FIELDS}
+
+
+def retrieve(collection, query_embedding: list[float], k: int = 4,
+             query_text: str = None, lexical=None) -> dict:
+    """
+    Top-k chunks for one query. With a lexical index and the query text,
+    vector and BM25 rankings are fused (hybrid retrieval).
+    """
     results = collection.query(
         query_embeddings=[query_embedding],
         n_results=k,
-        include=["distances", "documents", "metadatas"]
+        include=INCLUDE
+    )
+    if lexical is not None and query_text:
+        return fuse(collection, lexical, query_embedding, query_text, results, k)
+    return results
+
+
+def retrieve_batch(collection, query_embeddings: list[list[float]], k: int = 4,
+                   query_texts: list[str] = None, lexical=None) -> list[dict]:
+    """
+    One query for many embeddings, split back into one result per query,
+    each in the same shape `retrieve` returns.
+    """
+    if not query_embeddings:
+        return []
+    results = collection.query(
+        query_embeddings=query_embeddings,
+        n_results=k,
+        include=INCLUDE
     )
-    return results
\ No newline at end of file
+    batch = [{field: [results[field][i]] for field in FIELDS}
+             for i in range(len(query_embeddings))]
+    if lexical is not None and query_texts:
+        batch = [fuse(collection, lexical, embedding, text, result, k)
+                 for embedding, text, result in zip(query_embeddings, query_texts, batch)]
+    return batch
@@ -1,13 +1,146 @@
-import chromadb
-
-client = chromadb.Client()
-collection = client.get_or_create_collection(name="ad_knowledge")
-
-def add_chunks(chunks, embeddings, metadata):
-    for text, emb, meta in zip(chunks, embeddings, metadata):
-        collection.add(
-            documents=[text],
-            embeddings=[emb],
-            metadatas=[meta],
-            ids=[meta["id"]]
-        )
\ No newline at end of file
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from back.config.config import VECTOR_STORE_PATH, VECTOR_STORE_BATCH_SIZE, RETRIEVAL_CONFIG
+
+MANIFEST_PATH = VECTOR_STORE_PATH / "manifest.json"
+NUMPY_INDEX_PATH = VECTOR_STORE_PATH / "numpy_index"
+LEXICAL_INDEX_PATH = VECTOR_STORE_PATH / "lexical_index"
+
+_collection = None
+_index = None
+_lexical_index = None
+_lock = threading.Lock()
+
+
+def get_collection():
+    """The persistent collection, opened (and chromadb imported) on first use."""
+    global _collection
+    with _lock:
+        if _collection is None:
+            import chromadb
+            VECTOR_STORE_PATH.mkdir(parents=True, exist_ok=True)
+            client = chromadb.PersistentClient(path=str(VECTOR_STORE_PATH))
+            _collection = client.get_or_create_collection(name="ad_knowledge")
+    return _collection
+
+
+def add_chunks(chunks, embeddings, metadata, batch_size: int = VECTOR_STORE_BATCH_SIZE):
+    """Upsert chunks in large batches instead of one `add` per chunk."""
+    collection = get_collection()
+    for start in range(0, len(chunks), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            documents=chunks[start:end],
+            embeddings=embeddings[start:end],
+            metadatas=metadata[start:end],
+            ids=[meta["id"] for meta in metadata[start:end]]
+        )
+
+
+def delete_source(source: str):
+    """Remove every chunk previously ingested from `source`."""
+    get_collection().delete(where={"source": source})
+
+
+def load_manifest() -> dict:
+    """{source: "content hash:ingest signature"} of the documents currently in the store."""
+    if not MANIFEST_PATH.exists():
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    tmp_path = MANIFEST_PATH.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def manifest_version(manifest: dict = None) -> str:
+    """Digest of the manifest: changes whenever a document is (re)ingested or removed."""
+    manifest = load_manifest() if manifest is None else manifest
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def refresh_index():
+    """
+    Make the NumPy index (and the lexical index, for hybrid retrieval) match
+    the collection. An index saved for the current manifest version is loaded
+    from disk, otherwise it is rebuilt from the collection and saved under the
+    new version (files other processes have mapped are never overwritten).
+    """
+    version = manifest_version()
+    if RETRIEVAL_CONFIG["backend"] == "numpy":
+        _refresh_numpy_index(version)
+    if RETRIEVAL_CONFIG["hybrid"]:
+        _refresh_lexical_index(version)
+
+
+def _refresh_numpy_index(version: str):
+    global _index
+    import numpy as np
+    from .numpy_index import NumpyIndex
+
+    dtype = np.dtype(RETRIEVAL_CONFIG["dtype"])
+    # a RETRIEVAL_DTYPE change needs a new matrix, not the saved one
+    name = f"{version}-{dtype.name}"
+    path = NUMPY_INDEX_PATH / name
+    with _lock:
+        if _index is not None and _index.version == version:
+            return
+    if (path / "meta.json").exists():
+        index = NumpyIndex.load(path, mmap=RETRIEVAL_CONFIG["mmap"])
+    else:
+        index = NumpyIndex.from_collection(get_collection(), dtype=dtype, version=version)
+        index.save(path)
+        for stale in NUMPY_INDEX_PATH.iterdir():
+            # dot-prefixed: another process's save in progress
+            if stale.name != name and not stale.name.startswith("."):
+                shutil.rmtree(stale, ignore_errors=True)
+        if RETRIEVAL_CONFIG["mmap"]:
+            index = NumpyIndex.load(path, mmap=True)
+    with _lock:
+        _index = index
+
+
+def _refresh_lexical_index(version: str):
+    global _lexical_index
+    from .lexical_index import BM25Index
+
+    path = LEXICAL_INDEX_PATH / f"{version}.json"
+    with _lock:
+        if _lexical_index is not None and _lexical_index.version == version:
+            return
+    if path.exists():
+        index = BM25Index.load(path)
+    else:
+        index = BM25Index.from_collection(get_index(), version=version)
+        index.save(path)
+        for stale in LEXICAL_INDEX_PATH.iterdir():
+            if stale.name != path.name and not stale.name.startswith("."):
+                stale.unlink(missing_ok=True)
+    with _lock:
+        _lexical_index = index
+
+
+def get_index():
+    """What `retrieve` should query: the NumPy index, or the Chroma collection."""
+    if RETRIEVAL_CONFIG["backend"] == "numpy":
+        if _index is None:
+            refresh_index()
+        return _index
+    return get_collection()
+
+
+def get_lexical_index():
+    """The BM25 index for hybrid retrieval, or None when it is disabled."""
+    if not RETRIEVAL_CONFIG["hybrid"]:
+        return None
+    if _lexical_index is None:
+        refresh_index()
+    return _lexical_index
@@ -1,5 +1,53 @@
 import re
 import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping with a fixed number of entries and optional TTL (s)."""
+    def __init__(self, max_size: int, ttl: float = None):
+        self._data = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self._max_size <= 0:
+            return
+        expires = time.monotonic() + self._ttl if self._ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+_decoder = json.JSONDecoder()
+
+
 def clean_generated_text(generated_text: str, prompt: str) -> str:
     if generated_text.startswith(prompt):
         generated_text = generated_text[len(prompt):].strip()
@@ -21,22 +69,100 @@ def process_generated_text(generated_text: str, prompt: str) -> str:
         cleaned_text = re.sub(r'```(?:json)?\s*', '', cleaned_text, count=1)
         cleaned_text = re.sub(r'```\s*$', '', cleaned_text)
     
-    # Try to find and extract JSON object
-    # Find the first opening brace
+    # Decode the first JSON object, ignoring anything after it (single pass)
     start_idx = cleaned_text.find('{')
     if start_idx == -1:
         return {"error": "No JSON found in output", "raw_output": generated_text}
-    
-    # Try to parse from the first brace, expanding until we get valid JSON
-    for end_idx in range(len(cleaned_text), start_idx, -1):
+
+    try:
+        parsed, _ = _decoder.raw_decode(cleaned_text, start_idx)
+        return parsed
+    except json.JSONDecodeError:
+        return {"error": "Failed to parse JSON", "raw_output": generated_text}
+
+
+class JSONObjectScanner:
+    """
+    Incremental, single-pass scanner for the first top-level JSON object in
+    a stream of text chunks. `feed` returns True as soon as the object's
+    closing brace has been seen, so generation can be stopped there.
+    Braces inside strings and escaped quotes are handled.
+    """
+    _special = re.compile(r'[{}"\\]')
+
+    def __init__(self):
+        self._chunks = []
+        self._length = 0
+        self._start = -1
+        self._end = -1
+        self._depth = 0
+        self._in_string = False
+        self._skip_next = False
+
+    @property
+    def complete(self) -> bool:
+        return self._end != -1
+
+    def feed(self, chunk: str) -> bool:
+        if self.complete:
+            return True
+        offset = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+
+        pos = 0
+        if self._skip_next and chunk:
+            # escaped character split across chunks
+            self._skip_next = False
+            pos = 1
+        while True:
+            match = self._special.search(chunk, pos)
+            if match is None:
+                return False
+            i = match.start()
+            ch = chunk[i]
+            pos = i + 1
+            if self._in_string:
+                if ch == "\\":
+                    if pos < len(chunk):
+                        pos += 1
+                    else:
+                        self._skip_next = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = offset + i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end = offset + pos
+                    return True
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def object_text(self) -> str | None:
+        """The complete top-level object, or None if it has not closed yet."""
+        if not self.complete:
+            return None
+        return self.text[self._start:self._end]
+
+    def result(self) -> dict:
+        """Parsed object, in the same shape `process_generated_text` returns."""
+        if self._start == -1:
+            return {"error": "No JSON found in output", "raw_output": self.text}
+        if not self.complete:
+            return {"error": "Failed to parse JSON", "raw_output": self.text}
         try:
-            json_str = cleaned_text[start_idx:end_idx]
-            return json.loads(json_str)
+            return json.loads(self.object_text())
         except json.JSONDecodeError:
-            continue
-    
-    # If all attempts fail, return error
-    return {"error": "Failed to parse JSON", "raw_output": generated_text}
+            return {"error": "Failed to parse JSON", "raw_output": self.text}
 
 
 def process_llm_output(output: dict, prompt: str) -> dict: